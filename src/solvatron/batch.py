@@ -0,0 +1,108 @@
+import argparse
+import json
+import sys
+from collections.abc import Callable, Iterable
+from functools import partial
+from typing import TextIO
+
+from .cli import ArgumentError, cache_from_args, subdirs_for_platform
+from .common import KNOWN_SOLVERS, SolveResult, solve_all
+from .snapshot import local_channels
+
+
+def _strings(request: dict, key: str, default: list[str] | None) -> list[str] | None:
+    value = request.get(key, default)
+    # A string would be iterated character by character
+    if value is not None and not (
+        isinstance(value, list) and all(isinstance(item, str) for item in value)
+    ):
+        raise ArgumentError(f"'{key}' must be a list of strings.")
+    return value
+
+
+def parse_request(
+    request: dict, args: argparse.Namespace
+) -> tuple[list[str], list[str], list[str], list[str] | None]:
+    """
+    Validate a request and return its solvers, specs, channels and subdirs, with the
+    missing keys taken from `args`.
+    """
+    specs = _strings(request, "specs", None)
+    solvers = _strings(request, "solvers", args.solver)
+    channels = _strings(request, "channels", args.channel)
+    if not specs:
+        raise ArgumentError("One or more specs are required.")
+    if not solvers:
+        raise ArgumentError("One or more solvers are required.")
+    if not channels:
+        raise ArgumentError("One or more channels are required.")
+    if unknown := [solver for solver in solvers if solver not in KNOWN_SOLVERS]:
+        raise ArgumentError(f"Unknown solver(s): {', '.join(unknown)}")
+    if args.snapshot:
+        local_channels(args.snapshot, channels)
+    subdirs = subdirs_for_platform(request.get("platform", args.platform))
+    return solvers, specs, channels, subdirs
+
+
+def _solve_request(request: dict, args: argparse.Namespace) -> list[SolveResult]:
+    # Sequential and in-process, so in-memory indexes are reused across requests
+    return list(
+        solve_all(
+            *parse_request(request, args),
+            parallel=False,
+            isolated=args.isolated,
+            snapshot=args.snapshot,
+            cache=cache_from_args(args),
+            timeout=args.timeout,
+        )
+    )
+
+
+def respond(
+    line: str, default_id, solve_request: Callable[[dict], list[SolveResult]]
+) -> tuple[dict, int]:
+    """
+    Answer one JSON request line with `solve_request`. Returns the response and its exit
+    code: the highest one of its solves, or 1 for an invalid request or one that failed
+    (e.g. a spec the backend cannot parse, or a missing solver binary), so that one bad
+    request does not stop the others.
+    """
+    response = {"id": default_id}
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ArgumentError("Each request must be a JSON object.")
+        response["id"] = request.get("id", default_id)
+        results = solve_request(request)
+    except (ArgumentError, ValueError) as exc:
+        response["error"] = str(exc)
+        return response, 1
+    except Exception as exc:
+        response["error"] = f"{type(exc).__name__}: {exc}"
+        return response, 1
+    response["results"] = [result.to_dict() for result in results]
+    return response, max(result.exit_code for result in results)
+
+
+def run(lines: Iterable[str], out: TextIO, args: argparse.Namespace) -> int:
+    exit_code = 0
+    for lineno, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        response, code = respond(line, lineno, partial(_solve_request, args=args))
+        exit_code = max(exit_code, code)
+        out.write(json.dumps(response) + "\n")
+        out.flush()
+    return exit_code
+
+
+def main(args: argparse.Namespace) -> int:
+    in_file = sys.stdin if args.input == "-" else open(args.input)
+    out_file = open(args.output, "w") if args.output else sys.stdout
+    try:
+        return run(in_file, out_file, args)
+    finally:
+        if in_file is not sys.stdin:
+            in_file.close()
+        if out_file is not sys.stdout:
+            out_file.close()
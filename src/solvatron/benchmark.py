@@ -0,0 +1,266 @@
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import statistics
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+from tempfile import TemporaryDirectory
+
+from .cli import ArgumentError, subdirs_for_platform
+from .common import EXIT_TIMEOUT, SolveResult, timed_solve
+from .snapshot import local_channels
+
+# Keep these stable so numbers can be compared across machines and solver versions
+SUITES: dict[str, tuple[str, ...]] = {
+    "small": ("python",),
+    "medium": (
+        "python=3.12",
+        "numpy",
+        "scipy",
+        "pandas",
+        "matplotlib-base",
+        "requests",
+    ),
+    "huge": (
+        "python=3.12",
+        "numpy",
+        "scipy",
+        "pandas",
+        "scikit-learn",
+        "statsmodels",
+        "matplotlib",
+        "seaborn",
+        "bokeh",
+        "jupyterlab",
+        "ipywidgets",
+        "dask",
+        "xarray",
+        "netcdf4",
+        "gdal",
+        "geopandas",
+        "pyarrow",
+        "sqlalchemy",
+        "numba",
+        "sympy",
+        "opencv",
+        "pytorch",
+        "boto3",
+        "requests",
+        "nodejs",
+        "cmake",
+        "compilers",
+    ),
+}
+
+STATISTICS = ("n", "min", "median", "mean", "p95", "stddev")
+
+
+def _percentile(ordered: list[float], pct: float) -> float:
+    # nearest-rank method; well defined for any number of samples
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(seconds: list[float]) -> dict[str, float]:
+    ordered = sorted(seconds)
+    return {
+        "n": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "p95": _percentile(ordered, 95),
+        "stddev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+    }
+
+
+def _sample(result: SolveResult, mode: str, trial: int) -> dict:
+    return {
+        "solver": result.solver,
+        "mode": mode,
+        "trial": trial,
+        "seconds": result.seconds,
+        "phases": result.phases,
+        **result.resources,
+        "status": result.status,
+    }
+
+
+def _cold_environment(root: str) -> dict[str, str]:
+    # conda's repodata cache, and libmambapy's .solv files next to it, live in the package
+    # dirs (for mamba too); rattler and pixi have their own; the shards and anything else
+    # go to XDG_CACHE_HOME
+    return {
+        "CONDA_PKGS_DIRS": os.path.join(root, "pkgs"),
+        "RATTLER_CACHE_DIR": os.path.join(root, "rattler"),
+        "PIXI_CACHE_DIR": os.path.join(root, "pixi"),
+        "XDG_CACHE_HOME": os.path.join(root, "xdg"),
+    }
+
+
+def _set_environment(variables: dict[str, str]) -> None:
+    os.environ.update(variables)
+
+
+def run(
+    solver: str,
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str] | None,
+    trials: int = 5,
+    warmup: int = 1,
+    cold_trials: int = 1,
+    **options,
+) -> Iterator[dict]:
+    """
+    Yield one sample per timed trial. Cold trials get a brand new worker process each,
+    with empty on-disk caches, so nothing is cached in memory or on disk and the repodata is
+    fetched again; warm trials share a single worker process. The virtual packages are
+    detected once, here, rather than in every cold worker.
+    """
+    from .virtual import for_subdirs
+
+    options.setdefault("virtual_packages", for_subdirs(subdirs))
+    job = partial(timed_solve, solver, specs, channels, subdirs, **options)
+    mp_context = get_context("spawn")
+    for trial in range(cold_trials):
+        with (
+            TemporaryDirectory(prefix="solvatron-cold-") as root,
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=mp_context,
+                initializer=_set_environment,
+                initargs=(_cold_environment(root),),
+            ) as pool,
+        ):
+            result = pool.submit(job).result()
+        yield _sample(result, "cold", trial)
+    if not trials:
+        return
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as pool:
+        for _ in range(warmup):
+            pool.submit(job).result()
+        for trial in range(trials):
+            result = pool.submit(job).result()
+            yield _sample(result, "warm", trial)
+
+
+def main(args: argparse.Namespace) -> int:
+    specs = [*SUITES.get(args.suite, ()), *args.specs]
+    if not specs:
+        raise ArgumentError("Pass a --suite or one or more specs.")
+    if not args.solver:
+        raise ArgumentError("One or more solvers are required.")
+    if not args.channel:
+        raise ArgumentError("One or more channels are required.")
+    if args.trials < 0 or args.warmup < 0 or args.cold_trials < 0:
+        raise ArgumentError("--trials, --warmup and --cold-trials cannot be negative.")
+    if not args.trials and not args.cold_trials:
+        raise ArgumentError("Nothing to do with zero --trials and --cold-trials.")
+    if args.snapshot:
+        local_channels(args.snapshot, args.channel)
+    subdirs = subdirs_for_platform(args.platform)
+
+    suite = args.suite or "custom"
+    print(f"Benchmarking {len(specs)} specs ({suite}) with {', '.join(args.solver)}")
+    print()
+    exit_code = 0
+    samples = []
+    stats = []
+    for solver in args.solver:
+        solver_samples = list(
+            run(
+                solver,
+                specs,
+                args.channel,
+                subdirs,
+                trials=args.trials,
+                warmup=args.warmup,
+                cold_trials=args.cold_trials,
+                isolated=args.isolated,
+                snapshot=args.snapshot,
+                timeout=args.timeout,
+            )
+        )
+        statuses = {sample["status"] for sample in solver_samples}
+        if "timeout" in statuses:
+            exit_code = EXIT_TIMEOUT
+        elif statuses != {"solved"}:
+            exit_code = max(exit_code, 1)
+        samples.extend({"suite": suite, **sample} for sample in solver_samples)
+        for mode in ("cold", "warm"):
+            mode_samples = [s for s in solver_samples if s["mode"] == mode]
+            if not mode_samples:
+                continue
+            # Unsolvable and timed out trials say nothing about how fast a solve is
+            solved = [s for s in mode_samples if s["status"] == "solved"]
+            failed = len(mode_samples) - len(solved)
+            if not solved:
+                stats.append(
+                    {"suite": suite, "solver": solver, "mode": mode, "n": 0, "failed": failed}
+                )
+                print(f"⏱️  {solver:<22} {mode:<4}", "n=0  ", f"failed={failed}")
+                continue
+            summary = summarize([s["seconds"] for s in solved])
+            summary["failed"] = failed
+            # Worst case memory, typical CPU time
+            peak_rss = [s["peak_rss_mb"] for s in solved if "peak_rss_mb" in s]
+            cpu = [s["user_seconds"] + s["system_seconds"] for s in solved if "user_seconds" in s]
+            if peak_rss:
+                summary["peak_rss_mb"] = max(peak_rss)
+            if cpu:
+                summary["cpu_seconds"] = statistics.median(cpu)
+            stats.append({"suite": suite, "solver": solver, "mode": mode, **summary})
+            print(
+                f"⏱️  {solver:<22} {mode:<4}",
+                f"n={summary['n']:<3}",
+                *(f"{key}={summary[key]:.3f}s" for key in STATISTICS[1:]),
+                *([f"cpu={summary['cpu_seconds']:.3f}s"] if "cpu_seconds" in summary else []),
+                *([f"rss={summary['peak_rss_mb']:.0f}MiB"] if "peak_rss_mb" in summary else []),
+                *([f"failed={failed}"] if failed else []),
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "suite": suite,
+                    "specs": specs,
+                    "channels": args.channel,
+                    "platform": args.platform,
+                    "snapshot": args.snapshot,
+                    "machine": {
+                        "platform": platform.platform(),
+                        "machine": platform.machine(),
+                        "python": platform.python_version(),
+                        "cpu_count": os.cpu_count(),
+                    },
+                    "stats": stats,
+                    "samples": samples,
+                },
+                f,
+                indent=2,
+            )
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(
+                f,
+                fieldnames=(
+                    "suite",
+                    "solver",
+                    "mode",
+                    "trial",
+                    "seconds",
+                    "user_seconds",
+                    "system_seconds",
+                    "peak_rss_mb",
+                    "status",
+                ),
+                extrasaction="ignore",
+            )
+            writer.writeheader()
+            writer.writerows(samples)
+    return exit_code
@@ -0,0 +1,230 @@
+"""
+On-disk cache of solve outcomes, keyed by everything that can change them.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from functools import cache
+from pathlib import Path
+from typing import NamedTuple
+
+from .common import Record, SolutionNotFound, SolveResult, current_platform, phase
+from .virtual import VirtualPackage
+
+# Evict least recently used entries beyond this total size (bytes) ...
+DEFAULT_MAX_SIZE = 256 * 2**20
+# ... and any entry not used for this long (seconds)
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+# Evict at least this often (seconds) while storing, even if the cache is not full
+EVICT_INTERVAL = 3600
+# How long a repodata etag is trusted before asking the server again (seconds)
+FINGERPRINT_TTL = 60
+
+# Distributions whose version can change the outcome of each in-process solver
+_DISTRIBUTIONS: dict[str, tuple[str, ...]] = {
+    # conda's own default solver is libmamba; see _BACKENDS in common.py
+    "conda": ("conda", "conda-libmamba-solver", "libmambapy"),
+    "conda-classic-solver": ("conda",),
+    "conda-libmamba-solver": ("conda", "conda-libmamba-solver", "libmambapy"),
+    "conda-rattler-solver": ("conda", "conda-rattler-solver", "py-rattler"),
+    "libmambapy": ("conda", "libmambapy"),
+    "libmambapy-shards": ("conda", "libmambapy"),
+    "rattler": ("py-rattler",),
+}
+
+# (url or path) -> (timestamp, fingerprint)
+_FINGERPRINTS: dict[str, tuple[float, str | None]] = {}
+
+
+class CacheEntry(NamedTuple):
+    outcome: list[Record] | SolutionNotFound
+    # How long the original solve took
+    seconds: float
+
+
+def default_path() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache", "solvatron", "solves")
+
+
+@cache
+def solver_version(solver: str) -> str:
+    if solver in ("mamba", "pixi"):
+        from .common import run_command
+
+        returncode, stdout, _ = run_command([solver, "--version"])
+        return stdout.strip() if not returncode else ""
+
+    from importlib.metadata import PackageNotFoundError, version
+
+    versions = []
+    for distribution in _DISTRIBUTIONS[solver]:
+        try:
+            versions.append(f"{distribution}={version(distribution)}")
+        except PackageNotFoundError:
+            versions.append(f"{distribution}=?")
+    return ",".join(versions)
+
+
+def repodata_fingerprint(channel: str, subdir: str) -> str | None:
+    """
+    ETag (or Last-Modified) of the channel's repodata.json for `subdir`, or the mtime
+    for local channels. None if it cannot be determined (e.g. offline).
+    """
+    if channel.startswith("file://") or os.path.isabs(channel) or channel.startswith("."):
+        from urllib.request import url2pathname
+
+        if channel.startswith("file://"):
+            channel = url2pathname(channel[len("file://") :])
+        path = Path(channel, subdir, "repodata.json")
+        stat = path.stat() if path.is_file() else None
+        return f"{stat.st_mtime_ns}-{stat.st_size}" if stat else "missing"
+
+    if "://" not in channel:
+        channel = f"https://conda.anaconda.org/{channel}"
+    url = f"{channel.rstrip('/')}/{subdir}/repodata.json"
+    if (cached := _FINGERPRINTS.get(url)) and time.monotonic() - cached[0] < FINGERPRINT_TTL:
+        return cached[1]
+
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+
+    try:
+        with urlopen(Request(url, method="HEAD"), timeout=10) as response:
+            fingerprint = response.headers.get("ETag") or response.headers.get("Last-Modified")
+    except HTTPError as exc:
+        # Channels do not need to provide every subdir
+        fingerprint = "missing" if exc.code == 404 else None
+    except OSError:
+        fingerprint = None
+    _FINGERPRINTS[url] = time.monotonic(), fingerprint
+    return fingerprint
+
+
+@dataclass
+class SolveCache:
+    """
+    Solve outcomes stored as one JSON file per key. Reading an entry refreshes its mtime,
+    which is what eviction uses to find the least recently used ones. Storing evicts on the
+    first store, when a running estimate of the size exceeds `max_size`, or once
+    EVICT_INTERVAL has passed, rather than listing the directory every time.
+    With `refresh=True`, entries are never read but still written.
+    """
+
+    path: Path = field(default_factory=default_path)
+    max_size: int = DEFAULT_MAX_SIZE
+    max_age: float = DEFAULT_MAX_AGE
+    refresh: bool = False
+    # Size of the entries as of the last eviction plus what was stored since, and when that
+    # eviction was (time.monotonic())
+    _size: int | None = field(default=None, init=False, repr=False)
+    _evicted: float = field(default=0.0, init=False, repr=False)
+
+    def key(
+        self,
+        solver: str,
+        specs: list[str],
+        channels: list[str],
+        subdirs: list[str] | None,
+        virtual_packages: Iterable[VirtualPackage],
+    ) -> str | None:
+        """
+        Hash of the solve inputs, or None if the repodata state cannot be determined.
+        """
+        subdirs = list(subdirs or (current_platform(), "noarch"))
+        fingerprints = [
+            repodata_fingerprint(channel, subdir) for channel in channels for subdir in subdirs
+        ]
+        if None in fingerprints:
+            return None
+        payload = {
+            "solver": solver,
+            "solver_version": solver_version(solver),
+            # Order matters too: libmambapy solves with order_request=True
+            "specs": [" ".join(spec.split()) for spec in specs],
+            # Order matters: channel priority
+            "channels": channels,
+            "subdirs": subdirs,
+            "repodata": fingerprints,
+            "virtual_packages": sorted(map(str, virtual_packages)),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def lookup(
+        self,
+        solver: str,
+        specs: list[str],
+        channels: list[str],
+        subdirs: list[str] | None,
+        virtual_packages: Iterable[VirtualPackage],
+    ) -> tuple[str | None, CacheEntry | None]:
+        with phase("cache"):
+            key = self.key(solver, specs, channels, subdirs, virtual_packages)
+            if key is None or self.refresh:
+                return key, None
+            return key, self.load(key)
+
+    def load(self, key: str) -> CacheEntry | None:
+        path = Path(self.path, f"{key}.json")
+        try:
+            data = json.loads(path.read_text())
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if "error" in data:
+            return CacheEntry(SolutionNotFound(data["error"]), data["seconds"])
+        return CacheEntry([Record(**record) for record in data["records"]], data["seconds"])
+
+    def store(self, key: str, outcome: list[Record] | SolutionNotFound, seconds: float) -> None:
+        if isinstance(outcome, SolutionNotFound):
+            data = {"seconds": seconds, "error": str(outcome)}
+        else:
+            data = {"seconds": seconds, "records": [asdict(record) for record in outcome]}
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent solves never read a partial entry
+        path = Path(self.path, f"{key}.json")
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        text = json.dumps(data)
+        tmp_path.write_text(text)
+        os.replace(tmp_path, path)
+        if self._size is not None:
+            self._size += len(text)
+        if (
+            self._size is None
+            or self._size > self.max_size
+            or time.monotonic() - self._evicted > EVICT_INTERVAL
+        ):
+            self.evict()
+
+    def update(self, key: str, result: SolveResult, entry: CacheEntry | None) -> None:
+        """
+        Annotate `result` as a hit or a miss of `key`, storing its outcome on a miss.
+        """
+        if entry is None:
+            result.cache = "miss"
+            self.store(key, result.outcome, result.seconds)
+        else:
+            result.cache = "hit"
+            result.saved = max(entry.seconds - result.seconds, 0.0)
+
+    def evict(self) -> None:
+        entries = []
+        for path in self.path.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:  # removed by a concurrent eviction
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(reverse=True)
+        oldest_allowed = time.time() - self.max_age
+        total = kept = 0
+        for mtime, size, path in entries:
+            total += size
+            if mtime < oldest_allowed or total > self.max_size:
+                path.unlink(missing_ok=True)
+            else:
+                kept += size
+        self._size, self._evicted = kept, time.monotonic()
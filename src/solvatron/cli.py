@@ -1,68 +1,471 @@
 import argparse
 import os
-from difflib import ndiff
+import sys
 from pathlib import Path
 
 
 class ArgumentError(Exception): ...
 
 
-def cli(args: list[str] | None = None):
-    from typing import get_args
+def _shared_parser(several_platforms: bool = False) -> argparse.ArgumentParser:
+    from .common import EXIT_TIMEOUT, KNOWN_PLATFORMS, KNOWN_SOLVERS
+
+    p = argparse.ArgumentParser(add_help=False)
+    p.add_argument(
+        "-c",
+        "--channel",
+        action="append",
+        help="Where to pull packages from. Can be used several times. "
+        "First ones will have higher priority.",
+    )
+    p.add_argument(
+        "-s",
+        "--solver",
+        action="append",
+        choices=KNOWN_SOLVERS,
+        help="Which solver to use. Can be used several times.",
+    )
+    if several_platforms:
+        p.add_argument(
+            "--platform",
+            action="append",
+            choices=KNOWN_PLATFORMS,
+            help="Platform (or subdir) to run solves for; e.g. 'linux-64'. "
+            "Can be used several times.",
+        )
+    else:
+        p.add_argument(
+            "--platform",
+            choices=KNOWN_PLATFORMS,
+            help="Platform (or subdir) to run solves for; e.g. 'linux-64'. If cross-solving, "
+            "make sure to set appropriate CONDA_OVERRIDE_* environment variables.",
+        )
+    p.add_argument(
+        "--isolated",
+        action="store_true",
+        help="Run the conda-based solvers as 'python -m conda create --dry-run' subprocesses "
+        "instead of calling conda's solver API in-process.",
+    )
+    p.add_argument(
+        "--snapshot",
+        help="Solve against the repodata frozen in this directory by 'solvatron snapshot' "
+        "instead of the live channels. All solvers then read the same data, offline.",
+    )
+    p.add_argument(
+        "--timeout",
+        type=float,
+        help="Give up on each solve after this many seconds, killing it and any processes it "
+        f"started. Timed out solves are reported as such, with exit code {EXIT_TIMEOUT}.",
+    )
+    return p
+
 
-    from rattler.platform import PlatformLiteral
+def _cache_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(add_help=False)
+    p.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=os.environ.get("SOLVATRON_CACHE", "").lower() not in ("", "0", "false", "no"),
+        help="Reuse the outcome of identical solves (same solver version, specs, channels, "
+        "subdirs, repodata and virtual packages) from an on-disk cache. "
+        "Enabled by default if SOLVATRON_CACHE=1.",
+    )
+    p.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Solve again and overwrite the cached outcomes. Implies --cache.",
+    )
+    p.add_argument(
+        "--cache-dir",
+        help="Where to store cached outcomes. Defaults to $XDG_CACHE_HOME/solvatron/solves.",
+    )
+    return p
 
-    from .common import KNOWN_SOLVERS
+
+def cli(args: list[str] | None = None):
+    args = sys.argv[1:] if args is None else list(args)
+    if args and args[0] in COMMANDS:
+        return COMMANDS[args[0]](args[1:])
 
     p = argparse.ArgumentParser(
         prog="solvatron",
         description="Compare conda solves across different implementations.",
+        parents=[_shared_parser(), _cache_parser()],
         epilog="""
             Example:
             python -m solvatron -s rattler -c conda-forge python
+
+            Other commands: batch, benchmark, conflicts, prune, serve, snapshot, sweep.
+            Run 'python -m solvatron <command> --help' for details.
             """,
     )
+    p.set_defaults(command="solve")
     p.add_argument(
         "--compare",
         action="store_true",
-        help="Compare solutions. Must pass two solvers.",
+        help="Compare solutions. Must pass two or more solvers.",
     )
+    p.add_argument(
+        "--json",
+        action="store_true",
+        help="Write one JSON object per line as each solver finishes (records, errors, "
+        "exit status and timings), plus a comparison line with --compare.",
+    )
+    p.add_argument(
+        "--sequential",
+        action="store_true",
+        help="Run the solvers one after another instead of in parallel. "
+        "Use this when timing accuracy matters more than wall time.",
+    )
+    p.add_argument(
+        "-f",
+        "--file",
+        help="Path to file with one requirement per line. #-comments will be ignored.",
+    )
+    p.add_argument("specs", nargs="*", help="Requirements to solve for.")
+    return p.parse_args(args)
+
+
+def _batch_cli(args: list[str]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        prog="solvatron batch",
+        description="Solve many requests in a single process, reusing loaded indexes. "
+        "Each input line is a JSON object with 'specs' and, optionally, 'id', 'channels', "
+        "'platform' and 'solvers'. Missing keys default to the values passed on the command "
+        "line. One JSON line is written per request as soon as it finishes.",
+        parents=[_shared_parser(), _cache_parser()],
+        epilog="""
+            Example:
+            python -m solvatron batch -c conda-forge -s rattler requests.jsonl
+            """,
+    )
+    p.set_defaults(command="batch")
+    p.add_argument(
+        "-o",
+        "--output",
+        help="Where to write the JSONL results. Defaults to stdout.",
+    )
+    p.add_argument(
+        "input",
+        nargs="?",
+        default="-",
+        help="JSONL file with one solve request per line. Defaults to stdin.",
+    )
+    return p.parse_args(args)
+
+
+def _benchmark_cli(args: list[str]) -> argparse.Namespace:
+    from .benchmark import SUITES
+
+    p = argparse.ArgumentParser(
+        prog="solvatron benchmark",
+        description="Time repeated solves and report min/median/mean/p95/stddev per solver. "
+        "Cold trials run each solve in a fresh process; warm trials reuse one process per "
+        "solver, after the warm-up runs.",
+        parents=[_shared_parser()],
+        epilog="""
+            Example:
+            python -m solvatron benchmark -c conda-forge -s rattler -s libmambapy --suite medium
+            """,
+    )
+    p.set_defaults(command="benchmark")
+    p.add_argument(
+        "--suite",
+        choices=sorted(SUITES),
+        help="Named set of specs to benchmark. Can be combined with explicit specs.",
+    )
+    p.add_argument(
+        "-n",
+        "--trials",
+        type=int,
+        default=5,
+        help="Number of timed warm trials per solver. Default: %(default)s.",
+    )
+    p.add_argument(
+        "--warmup",
+        type=int,
+        default=1,
+        help="Number of untimed runs before the warm trials. Default: %(default)s.",
+    )
+    p.add_argument(
+        "--cold-trials",
+        type=int,
+        default=1,
+        help="Number of timed trials in a fresh process per solver. Default: %(default)s.",
+    )
+    p.add_argument("--json", help="Write the raw samples and statistics to this JSON file.")
+    p.add_argument("--csv", help="Write the raw samples to this CSV file.")
+    p.add_argument("specs", nargs="*", help="Requirements to solve for.")
+    return p.parse_args(args)
+
+
+def _snapshot_cli(args: list[str]) -> argparse.Namespace:
+    from .common import KNOWN_PLATFORMS
+
+    p = argparse.ArgumentParser(
+        prog="solvatron snapshot",
+        description="Freeze the current repodata of the given channels into a directory of "
+        "local file channels (with zstd-compressed and libsolv variants), to be used later "
+        "with --snapshot.",
+        epilog="""
+            Example:
+            python -m solvatron snapshot -c conda-forge --platform linux-64 ./snapshot
+            """,
+    )
+    p.set_defaults(command="snapshot")
     p.add_argument(
         "-c",
         "--channel",
         action="append",
-        help="Where to pull packages from. Can be used several times. "
-        "First ones will have higher priority.",
+        help="Channel to snapshot. Can be used several times.",
     )
     p.add_argument(
-        "-s",
-        "--solver",
+        "--platform",
         action="append",
-        choices=KNOWN_SOLVERS,
-        help="Which solver to use. Can be used several times.",
+        choices=KNOWN_PLATFORMS,
+        help="Platform (or subdir) to snapshot, besides noarch. Can be used several times. "
+        "Defaults to the current platform.",
+    )
+    p.add_argument("output", help="Directory to write the snapshot to.")
+    return p.parse_args(args)
+
+
+def _prune_cli(args: list[str]) -> argparse.Namespace:
+    from .common import KNOWN_PLATFORMS, KNOWN_SOLVERS
+
+    p = argparse.ArgumentParser(
+        prog="solvatron prune",
+        description="Write a snapshot with only the records whose names can be reached from "
+        "the given specs through their dependencies, so solvers parse a much smaller index. "
+        "Use it with --snapshot.",
+        epilog="""
+            Example:
+            python -m solvatron prune -c conda-forge --verify rattler ./pruned python numpy
+            """,
+    )
+    p.set_defaults(command="prune")
+    p.add_argument(
+        "-c",
+        "--channel",
+        action="append",
+        help="Channel to prune. Can be used several times.",
     )
     p.add_argument(
         "--platform",
-        choices=[p for p in get_args(PlatformLiteral) if p not in ("unknown", "noarch")],
-        help="Platform (or subdir) to run solves for; e.g. 'linux-64'. "
-        "If cross-solving, make sure to set appropriate CONDA_OVERRIDE_* environment variables.",
+        action="append",
+        choices=KNOWN_PLATFORMS,
+        help="Platform (or subdir) to prune, besides noarch. Can be used several times. "
+        "Defaults to the current platform.",
     )
     p.add_argument(
-        "-f",
-        "--file",
-        help="Path to file with one requirement per line. #-comments will be ignored.",
+        "--snapshot",
+        help="Prune this snapshot instead of downloading the current repodata.",
+    )
+    p.add_argument(
+        "--verify",
+        action="append",
+        choices=KNOWN_SOLVERS,
+        help="Check that this solver finds the same solution with the full and the pruned "
+        "repodata. Can be used several times.",
+    )
+    p.add_argument("output", help="Directory to write the pruned snapshot to.")
+    p.add_argument("specs", nargs="+", help="Requirements the pruned repodata must serve.")
+    return p.parse_args(args)
+
+
+def _serve_cli(args: list[str]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        prog="solvatron serve",
+        description="Keep solver state warm in a pool of worker processes and answer solve "
+        "requests over a Unix socket (one JSON request per line, as in 'batch') or a localhost "
+        "HTTP port (POST one JSON request). Responses have the format of 'batch'.",
+        parents=[_shared_parser(), _cache_parser()],
+        epilog="""
+            Example:
+            python -m solvatron serve -c conda-forge -s libmambapy --socket /tmp/solvatron.sock
+            """,
+    )
+    p.set_defaults(command="serve")
+    p.add_argument("--socket", help="Path of the Unix socket to listen on.")
+    p.add_argument("--port", type=int, help="Localhost HTTP port to listen on.")
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="Number of worker processes. Each one keeps its own indexes in memory. "
+        "Default: %(default)s.",
+    )
+    p.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=300,
+        help="Seconds between checks for new repodata, which then gets loaded in the "
+        "background. 0 disables the checks. Default: %(default)s.",
+    )
+    return p.parse_args(args)
+
+
+def _sweep_cli(args: list[str]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        prog="solvatron sweep",
+        description="Solve the same specs for several platforms and solvers in parallel, and "
+        "report a platform x solver matrix. Cross-platform solves get default virtual package "
+        "overrides (e.g. __glibc, __osx), unless set in the environment or with --override.",
+        parents=[_shared_parser(several_platforms=True), _cache_parser()],
+        epilog="""
+            Example:
+            python -m solvatron sweep -c conda-forge -s rattler -s libmambapy
+                --platform linux-64 --platform osx-arm64 --platform win-64
+                --override linux-64:GLIBC=2.28 python numpy
+            """,
+    )
+    p.set_defaults(command="sweep")
+    p.add_argument(
+        "--override",
+        action="append",
+        default=[],
+        metavar="[PLATFORM:]NAME=VALUE",
+        help="Set CONDA_OVERRIDE_<NAME>=VALUE for the solves of PLATFORM, or of all of them. "
+        "Can be used several times.",
+    )
+    p.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Maximum number of solves running at the same time. Default: %(default)s.",
+    )
+    p.add_argument(
+        "--json",
+        action="store_true",
+        help="Write one JSON object per solve, with its platform, and then the matrix.",
     )
     p.add_argument("specs", nargs="*", help="Requirements to solve for.")
     return p.parse_args(args)
 
 
+def _conflicts_cli(args: list[str]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        prog="solvatron conflicts",
+        description="Find a minimal subset of the specs that is still unsolvable, with delta "
+        "debugging. Candidate subsets are solved in parallel by worker processes that keep the "
+        "index loaded between solves; in-process solvers like libmambapy or rattler work best.",
+        parents=[_shared_parser()],
+        epilog="""
+            Example:
+            python -m solvatron conflicts -s libmambapy -c conda-forge python=3.8 numpy=2 scipy
+            """,
+    )
+    p.set_defaults(command="conflicts")
+    p.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes. Default: %(default)s.",
+    )
+    p.add_argument("specs", nargs="*", help="Unsolvable requirements to minimize.")
+    return p.parse_args(args)
+
+
+COMMANDS = {
+    "batch": _batch_cli,
+    "benchmark": _benchmark_cli,
+    "conflicts": _conflicts_cli,
+    "prune": _prune_cli,
+    "serve": _serve_cli,
+    "snapshot": _snapshot_cli,
+    "sweep": _sweep_cli,
+}
+
+
+def subdirs_for_platform(platform: str | None) -> list[str] | None:
+    from .common import current_platform
+
+    if not platform:
+        return None
+    target_os = platform.split("-")[0]
+    if not current_platform().startswith(target_os):
+        if target_os == "linux" and not all(
+            os.environ.get(f"CONDA_OVERRIDE_{var}") for var in ("LINUX", "GLIBC", "UNIX")
+        ):
+            raise ArgumentError(
+                "When cross-solving for linux, you must set __glibc, __unix and __linux; e.g.\n"
+                "CONDA_OVERRIDE_GLIBC=2.17 CONDA_OVERRIDE_LINUX=5 CONDA_OVERRIDE_UNIX=1 "
+                "python -m solvatron ..."
+            )
+        elif target_os == "osx" and not all(
+            os.environ.get(f"CONDA_OVERRIDE_{var}") for var in ("OSX", "UNIX")
+        ):
+            raise ArgumentError(
+                "When cross-solving for macOS, you must set the OSX version; e.g.:\n"
+                "CONDA_OVERRIDE_OSX=11.0 python -m solvatron ..."
+            )
+        elif target_os == "win" and not os.environ.get("CONDA_OVERRIDE_WIN"):
+            raise ArgumentError(
+                "When cross-solving for Windows, you must set the Windows version; e.g.:\n"
+                "CONDA_OVERRIDE_WIN=10 python -m solvatron ..."
+            )
+    return [platform, "noarch"]
+
+
+def cache_from_args(args: argparse.Namespace):
+    if not (args.cache or args.refresh_cache):
+        return None
+
+    from .cache import SolveCache
+
+    cache = SolveCache(refresh=args.refresh_cache)
+    if args.cache_dir:
+        cache.path = Path(args.cache_dir)
+    return cache
+
+
 def main(args: argparse.Namespace) -> int:
-    import time
-    from datetime import timedelta
+    if getattr(args, "timeout", None) is not None and args.timeout <= 0:
+        raise ArgumentError("--timeout must be positive.")
+    if args.command == "batch":
+        from .batch import main as batch_main
 
-    from rattler import MatchSpec, Platform
+        return batch_main(args)
+    if args.command == "benchmark":
+        from .benchmark import main as benchmark_main
 
-    from .common import SolutionNotFound, color_diff, report, solve
+        return benchmark_main(args)
+    if args.command == "snapshot":
+        from .snapshot import main as snapshot_main
+
+        return snapshot_main(args)
+    if args.command == "conflicts":
+        from .conflicts import main as conflicts_main
+
+        return conflicts_main(args)
+    if args.command == "prune":
+        from .prune import main as prune_main
+
+        return prune_main(args)
+    if args.command == "serve":
+        from .serve import main as serve_main
+
+        return serve_main(args)
+    if args.command == "sweep":
+        from .sweep import main as sweep_main
+
+        return sweep_main(args)
+
+    from datetime import timedelta
+
+    from . import compare
+    from .common import (
+        Solution,
+        color_diff,
+        format_phases,
+        format_resources,
+        format_solv_cache,
+        report,
+        solve_all,
+        spec_name,
+    )
 
     specs = args.specs
     if args.file:
@@ -79,106 +482,207 @@ def main(args: argparse.Namespace) -> int:
         raise ArgumentError("One or more solvers are required.")
     if not args.channel:
         raise ArgumentError("One or more channels are required.")
-    if args.compare and not len(args.solver):
+    if args.compare and len(args.solver) < 2:
         raise ArgumentError(
-            args.compare,
-            f"With --compare, two solvers MUST be passed, but you passed {len(args.solver)}.",
+            "With --compare, two or more solvers MUST be passed, "
+            f"but you passed {len(args.solver)}."
         )
-    if args.platform:
-        subdirs = [args.platform, "noarch"]
-        target_os = args.platform.split("-")[0]
-        if not str(Platform.current()).startswith(target_os):
-            if target_os == "linux" and not all(
-                os.environ.get(f"CONDA_OVERRIDE_{var}") for var in ("LINUX", "GLIBC", "UNIX")
-            ):
-                raise ArgumentError(
-                    "When cross-solving for linux, you must set __glibc, __unix and __linux; e.g.\n"
-                    "CONDA_OVERRIDE_GLIBC=2.17 CONDA_OVERRIDE_LINUX=5 CONDA_OVERRIDE_UNIX=1 "
-                    "python -m solvatron ..."
-                )
-            elif target_os == "osx" and not all(
-                os.environ.get(f"CONDA_OVERRIDE_{var}") for var in ("OSX", "UNIX")
-            ):
-                raise ArgumentError(
-                    "When cross-solving for macOS, you must set the OSX version; e.g.:\n"
-                    "CONDA_OVERRIDE_OSX=11.0 python -m solvatron ..."
-                )
-            elif target_os == "win" and not os.environ.get("CONDA_OVERRIDE_WIN"):
-                raise ArgumentError(
-                    "When cross-solving for Windows, you must set the Windows version; e.g.:\n"
-                    "CONDA_OVERRIDE_WIN=10 python -m solvatron ..."
-                )
-    else:
-        subdirs = None
+    if args.snapshot:
+        from .snapshot import local_channels
+
+        local_channels(args.snapshot, args.channel)
+    subdirs = subdirs_for_platform(args.platform)
+    if args.json:
+        return _main_json(args, specs, subdirs)
 
     exit_code = 0
-    results = []
-    timings = []
+    solved = []
     if args.compare:
-        title = f"Comparing {args.solver[0]} vs {args.solver[1]}"
+        title = f"Comparing {' vs '.join(args.solver)}"
         print("-" * len(title))
         print(title)
         print("-" * len(title))
 
-    requested_names = [MatchSpec(spec, strict=False).name.normalized for spec in specs]
-    for solver in args.solver:
-        t0 = time.perf_counter()
-        try:
-            outcome = solve(
-                solver=solver,
-                specs=specs,
-                channels=args.channel,
-                subdirs=subdirs,
-            )
-        except SolutionNotFound as exc:
-            outcome = exc
-            exit_code = 1
-        t1 = time.perf_counter()
-        if exit_code == 0 and args.compare:
-            results.append(sorted(outcome))
-            timings.append(t1 - t0)
+    requested_names = {spec_name(spec) for spec in specs}
+    cache = cache_from_args(args)
+    results = []
+    for result in solve_all(
+        args.solver,
+        specs=specs,
+        channels=args.channel,
+        subdirs=subdirs,
+        parallel=not args.sequential,
+        isolated=args.isolated,
+        snapshot=args.snapshot,
+        cache=cache,
+        timeout=args.timeout,
+    ):
+        results.append(result)
+        if not isinstance(result.outcome, Solution):
+            exit_code = max(exit_code, result.exit_code)
+            _print_result(result)
+        elif args.compare:
+            solved.append(result)
         else:
-            title = f"Solving for {solver}"
-            print("-" * len(title))
-            print(title)
-            print("-" * len(title))
-            report(outcome)
-            print()
-            print(f"⏱️ Took {timedelta(seconds=t1 - t0)}s")
-            print()
+            _print_result(result)
 
-    if args.compare and len(results) == 2:
-        if results[0] != results[1]:
+    if args.compare and exit_code:
+        # Nothing to compare; still show what the other solvers found
+        for result in solved:
+            _print_result(result)
+    elif args.compare:
+        solutions = {result.solver: result.outcome for result in solved}
+        rows = compare.table(solutions)
+        if rows:
             print()
             print("⚠️  Different solutions observed!")
             print()
-            print(
-                *color_diff(
-                    "Legend:",
-                    "  same in both",
-                    f"- only in {args.solver[0]}",
-                    f"+ only in {args.solver[1]}",
-                    "",
-                    "Requested specs diff:",
-                    *ndiff(
-                        [str(r) for r in results[0] if r.name in requested_names],
-                        [str(r) for r in results[1] if r.name in requested_names],
-                    ),
-                    "All packages diff:",
-                    *ndiff(
-                        list(map(str, results[0])),
-                        list(map(str, results[1])),
+            if len(solutions) == 2:
+                a, b = solutions
+                changes = compare.diff(solutions[a], solutions[b])
+                print(
+                    *color_diff(
+                        "Legend:",
+                        f"- only in {a}",
+                        f"+ only in {b}",
+                        f"~ {a} vs {b}",
+                        "",
+                        "Requested specs diff:",
+                        *(str(c) for c in changes if c.name in requested_names),
+                        "",
+                        "All packages diff:",
+                        *(str(c) for c in changes),
                     ),
-                ),
-                sep="\n",
-            )
+                    sep="\n",
+                )
+            else:
+                _print_table(rows, requested_names)
+                print()
+                _print_matrix(compare.matrix(solutions))
             print()
-            exit_code = 1
+            exit_code = max(exit_code, 1)
         else:
-            report(results[0])
+            report(solved[0].outcome)
             print()
-            exit_code = 0
-        print(f"⏱️  {args.solver[0]} took {timedelta(seconds=timings[0])}s")
-        print(f"⏱️  {args.solver[1]} took {timedelta(seconds=timings[1])}s")
+        for result in solved:
+            print(f"⏱️  {result.solver} took {timedelta(seconds=result.seconds)}s")
+            if result.phases:
+                print(f"   {format_phases(result.phases)}")
+            if result.resources:
+                print(f"   {format_resources(result.resources)}")
+            if result.solv_cache:
+                print(f"   {format_solv_cache(result.solv_cache)}")
+
+    if cache is not None:
+        _print_cache_stats(results)
+    return exit_code
+
+
+def _print_result(result) -> None:
+    from datetime import timedelta
+
+    from .common import format_phases, format_resources, format_solv_cache, report
+
+    title = f"Solving for {result.solver}"
+    print("-" * len(title))
+    print(title)
+    print("-" * len(title))
+    report(result.outcome)
+    print()
+    print(f"⏱️ Took {timedelta(seconds=result.seconds)}s")
+    if result.phases:
+        print(f"   {format_phases(result.phases)}")
+    if result.resources:
+        print(f"   {format_resources(result.resources)}")
+    if result.solv_cache:
+        print(f"   {format_solv_cache(result.solv_cache)}")
+    if result.cache == "hit":
+        print(f"   cached outcome, saved {result.saved:.3f}s")
+    print()
+
+
+def _print_cache_stats(results: list) -> None:
+    hits = sum(result.cache == "hit" for result in results)
+    misses = sum(result.cache == "miss" for result in results)
+    saved = sum(result.saved for result in results)
+    print(f"🗄️  Cache: {hits} hit(s), {misses} miss(es), {saved:.3f}s saved")
+
+
+def _print_table(rows: dict, requested_names: set[str]) -> None:
+    solvers = list(next(iter(rows.values())))
+    print("Packages that differ (* = requested):")
+    print()
+    cells = []
+    for name, row in rows.items():
+        show_channel = len({(r.channel, r.subdir) for r in row.values() if r}) > 1
+        cells.append(
+            [
+                f"{name}{' *' if name in requested_names else ''}",
+                *(
+                    "-"
+                    if r is None
+                    else f"{r.version}-{r.build}"
+                    + (f" ({r.channel}/{r.subdir})" if show_channel else "")
+                    for r in row.values()
+                ),
+            ]
+        )
+    widths = [max(map(len, column)) for column in zip(["package", *solvers], *cells)]
+    for line in (["package", *solvers], *cells):
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip())
+
+
+def _print_matrix(counts: dict[str, dict[str, int]]) -> None:
+    solvers = list(counts)
+    width = max(map(len, solvers))
+    print("Number of differing packages:")
+    print()
+    print(" " * width, *(solver.rjust(len(solver)) for solver in solvers), sep="  ")
+    for a in solvers:
+        print(a.ljust(width), *(str(counts[a][b]).rjust(len(b)) for b in solvers), sep="  ")
+
+
+def _main_json(args: argparse.Namespace, specs: list[str], subdirs: list[str] | None) -> int:
+    import json
+
+    from . import compare
+    from .common import Solution, solve_all
+
+    exit_code = 0
+    solutions = {}
+    for result in solve_all(
+        args.solver,
+        specs=specs,
+        channels=args.channel,
+        subdirs=subdirs,
+        parallel=not args.sequential,
+        ordered=False,
+        isolated=args.isolated,
+        snapshot=args.snapshot,
+        cache=cache_from_args(args),
+        timeout=args.timeout,
+    ):
+        if not isinstance(result.outcome, Solution):
+            exit_code = max(exit_code, result.exit_code)
+        else:
+            solutions[result.solver] = result.outcome
+        print(json.dumps(result.to_dict()), flush=True)
 
+    if args.compare and len(solutions) == len(args.solver):
+        solutions = {solver: solutions[solver] for solver in args.solver}
+        rows = compare.table(solutions)
+        comparison = {
+            "solvers": list(solutions),
+            "identical": not rows,
+            "matrix": compare.matrix(solutions),
+            "packages": {
+                name: {solver: str(r) if r else None for solver, r in row.items()}
+                for name, row in rows.items()
+            },
+        }
+        if len(solutions) == 2:
+            a, b = solutions
+            comparison["changes"] = [c.to_dict() for c in compare.diff(solutions[a], solutions[b])]
+        print(json.dumps({"comparison": comparison}), flush=True)
+        exit_code = 0 if comparison["identical"] else 1
     return exit_code
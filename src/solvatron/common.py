@@ -1,4 +1,19 @@
-from dataclasses import dataclass
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field, fields
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .cache import SolveCache
+    from .virtual import VirtualPackage
 
 KNOWN_SOLVERS: tuple[str, ...] = (
     "conda",
@@ -6,13 +21,75 @@ KNOWN_SOLVERS: tuple[str, ...] = (
     "conda-libmamba-solver",
     "conda-rattler-solver",
     "libmambapy",
+    "libmambapy-shards",
     "mamba",
     "pixi",
     "rattler",
 )
 
+# Same as rattler's PlatformLiteral, minus 'noarch' and 'unknown'; listed here so the
+# CLI does not need to import rattler to validate --platform
+KNOWN_PLATFORMS: tuple[str, ...] = (
+    "emscripten-wasm32",
+    "freebsd-64",
+    "linux-32",
+    "linux-64",
+    "linux-aarch64",
+    "linux-armv6l",
+    "linux-armv7l",
+    "linux-loongarch64",
+    "linux-ppc",
+    "linux-ppc64",
+    "linux-ppc64le",
+    "linux-riscv32",
+    "linux-riscv64",
+    "linux-s390x",
+    "osx-64",
+    "osx-arm64",
+    "wasi-wasm32",
+    "win-32",
+    "win-64",
+    "win-arm64",
+    "zos-z",
+)
+
+
+def current_platform() -> str:
+    """
+    Conda subdir of the running interpreter, e.g. 'linux-64' or 'osx-arm64'.
+    """
+    import platform
+
+    if sys.platform.startswith("linux"):
+        os_name = "linux"
+    elif sys.platform == "darwin":
+        os_name = "osx"
+    elif sys.platform == "win32":
+        os_name = "win"
+    else:
+        os_name = re.sub(r"\d+$", "", sys.platform)
+    machine = platform.machine().lower()
+    if machine in ("x86_64", "amd64"):
+        arch = "64"
+    elif machine in ("i386", "i686", "x86"):
+        arch = "32"
+    elif machine in ("aarch64", "arm64"):
+        arch = "aarch64" if os_name == "linux" else "arm64"
+    else:
+        arch = machine
+    return f"{os_name}-{arch}"
 
-@dataclass(frozen=True, order=True, eq=True)
+
+def spec_name(spec: str) -> str:
+    """
+    Normalized package name of a MatchSpec string, e.g. 'numpy' for
+    'conda-forge::NumPy>=1.26'.
+    """
+    match = re.match(r"\s*([^\s=<>!~\[]+)", spec.rsplit("::", 1)[-1])
+    return match.group(1).lower() if match else ""
+
+
+@dataclass(frozen=True, order=True, eq=True, slots=True)
 class Record:
     name: str
     version: str
@@ -20,46 +97,253 @@ class Record:
     channel: str
     subdir: str
 
+    def __post_init__(self):
+        # Channels, subdirs and most names and versions repeat across solutions
+        for name in _RECORD_FIELDS:
+            object.__setattr__(self, name, sys.intern(getattr(self, name)))
+
     def __str__(self):
         return f"{self.channel}/{self.subdir}::{self.name}-{self.version}-{self.build}"
 
 
+_RECORD_FIELDS: tuple[str, ...] = tuple(f.name for f in fields(Record))
+
+# Strings of the records stored in Solutions, by id; ids only make sense in this process
+_STRINGS: list[str] = []
+_STRING_IDS: dict[str, int] = {}
+_STRINGS_LOCK = threading.Lock()
+
+
+def _string_id(value: str) -> int:
+    if (string_id := _STRING_IDS.get(value)) is None:
+        with _STRINGS_LOCK:
+            if (string_id := _STRING_IDS.get(value)) is None:
+                string_id = len(_STRINGS)
+                _STRINGS.append(sys.intern(value))
+                _STRING_IDS[_STRINGS[-1]] = string_id
+    return string_id
+
+
+class Solution(Sequence[Record]):
+    """
+    The records of a solution, sorted, stored as one array of string ids per Record
+    field instead of as Record objects; records are built again on access. Equal
+    solutions have equal arrays, so comparing and hashing them never touches the strings.
+    """
+
+    __slots__ = ("_columns",)
+
+    def __init__(self, records: Iterable[Record] = ()):
+        records = sorted(records)
+        self._columns = tuple(
+            array("I", [_string_id(getattr(record, name)) for record in records])
+            for name in _RECORD_FIELDS
+        )
+
+    def __len__(self) -> int:
+        return len(self._columns[0])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Record(*(_STRINGS[column[index]] for column in self._columns))
+
+    def __iter__(self) -> Iterator[Record]:
+        for ids in zip(*self._columns):
+            yield Record(*(_STRINGS[string_id] for string_id in ids))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Solution):
+            return self._columns == other._columns
+        if isinstance(other, list):
+            return list(self) == sorted(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(tuple(column.tobytes() for column in self._columns))
+
+    def __repr__(self) -> str:
+        return f"Solution({list(self)!r})"
+
+    def __reduce__(self):
+        # Other processes have their own string ids
+        return Solution, (list(self),)
+
+
 class SolutionNotFound(Exception):
     pass
 
 
-def solver_to_callable(solver: str):
-    from functools import partial
+class SolveTimeout(Exception):
+    """
+    The solve was killed before it finished; see timed_solve(timeout=...).
+    """
+
+
+# Exit code of the solves that time out, as with coreutils' timeout
+EXIT_TIMEOUT = 124
+
+
+# Collects the phase() spans of the solve running in the current context; see timed_solve()
+_PHASES: ContextVar[dict[str, float] | None] = ContextVar("_PHASES", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a named step of a solve (e.g. 'fetch', 'index', 'solve'). Backends wrap their
+    steps with this; repeated spans with the same name are added up. Outside of
+    timed_solve() it does nothing.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if (phases := _PHASES.get()) is not None:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - t0
+
+
+# Outcomes of libmambapy's .solv cache lookups in the solve running in the current context;
+# see count_solv_cache()
+_SOLV_CACHE: ContextVar[dict[str, int] | None] = ContextVar("_SOLV_CACHE", default=None)
+
+
+def count_solv_cache(outcome: str) -> None:
+    """
+    Count a 'hit', 'miss' or 'invalid' .solv file. Outside of timed_solve() it does nothing.
+    """
+    if (counts := _SOLV_CACHE.get()) is not None:
+        counts[outcome] = counts.get(outcome, 0) + 1
 
-    if solver in ("conda", "conda-libmamba-solver"):
-        from .conda import solve
 
-        return partial(solve, solver="libmamba")
-    if solver == "conda-rattler-solver":
-        from .conda import solve
+# time.monotonic() by which the solve running in the current context must finish;
+# run_command() kills its children then. See timed_solve()
+_DEADLINE: ContextVar[float | None] = ContextVar("_DEADLINE", default=None)
 
-        return partial(solve, solver="rattler")
-    elif solver == "conda-classic-solver":
-        from .conda import solve
+# Resource usage of the child processes run by the solve in the current context;
+# see run_command() and resource_usage()
+_CHILDREN: ContextVar[dict[str, float | None] | None] = ContextVar("_CHILDREN", default=None)
 
-        return partial(solve, solver="classic")
-    if solver == "libmambapy":
-        from .libmambapy import solve
 
-        return solve
-    if solver == "mamba":
-        from .mamba import solve
+def _maxrss_mib(maxrss: int) -> float:
+    # ru_maxrss is in bytes on macOS, KiB elsewhere
+    return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10
 
-        return solve
-    if solver == "rattler":
-        from .rattler import solve
 
-        return solve
-    if solver == "pixi":
-        from .pixi import solve
+def _reset_peak_rss() -> None:
+    # Linux can reset the high water mark, so each solve gets its own peak even when
+    # several run in the same process
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
 
-        return solve
-    raise ValueError(f"Unknown solver: {solver}")
+
+def _windows_usage(handle: int) -> tuple[float, float, float]:
+    """
+    Peak working set (MiB) and user and system CPU seconds of the process behind `handle`,
+    which may have exited already.
+    """
+    import ctypes
+    from ctypes import wintypes
+
+    class MemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    handle = wintypes.HANDLE(handle)
+    counters = MemoryCounters(cb=ctypes.sizeof(MemoryCounters))
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+        raise ctypes.WinError()
+    # creation, exit, kernel and user times, the last two in units of 100 ns
+    times = [wintypes.FILETIME() for _ in range(4)]
+    if not ctypes.windll.kernel32.GetProcessTimes(handle, *map(ctypes.byref, times)):
+        raise ctypes.WinError()
+    kernel, user = ((t.dwHighDateTime << 32 | t.dwLowDateTime) / 1e7 for t in times[2:])
+    return counters.PeakWorkingSetSize / 2**20, user, kernel
+
+
+def _peak_rss() -> float | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    if sys.platform == "win32":
+        import ctypes
+
+        ctypes.windll.kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+        return _windows_usage(ctypes.windll.kernel32.GetCurrentProcess())[0]
+    import resource
+
+    return _maxrss_mib(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+@contextmanager
+def resource_usage(usage: dict[str, float]):
+    """
+    Fill `usage` with the peak RSS (MiB) and user/system CPU seconds spent in the block.
+    If the block runs child processes through run_command(), the peak RSS is theirs and
+    their CPU time is included; otherwise the peak is this process's.
+    """
+    children = {"peak_rss_mb": 0.0, "user_seconds": 0.0, "system_seconds": 0.0, "count": 0}
+    token = _CHILDREN.set(children)
+    _reset_peak_rss()
+    t0 = os.times()
+    try:
+        yield
+    finally:
+        t1 = os.times()
+        _CHILDREN.reset(token)
+        usage["user_seconds"] = t1.user - t0.user + children["user_seconds"]
+        usage["system_seconds"] = t1.system - t0.system + children["system_seconds"]
+        peak_rss = children["peak_rss_mb"] if children["count"] else _peak_rss()
+        if peak_rss is not None:
+            usage["peak_rss_mb"] = peak_rss
+
+
+# solver name -> (backend module, fixed keyword arguments for its solve functions)
+_BACKENDS: dict[str, tuple[str, dict]] = {
+    "conda": ("conda", {"solver": "libmamba"}),
+    "conda-classic-solver": ("conda", {"solver": "classic"}),
+    "conda-libmamba-solver": ("conda", {"solver": "libmamba"}),
+    "conda-rattler-solver": ("conda", {"solver": "rattler"}),
+    "libmambapy": ("libmambapy", {}),
+    "libmambapy-shards": ("libmambapy", {"shards": True}),
+    "mamba": ("mamba", {}),
+    "pixi": ("pixi", {}),
+    "rattler": ("rattler", {}),
+}
+
+
+def solver_to_callable(solver: str, isolated: bool = False, asynchronous: bool = False):
+    """
+    Return the backend function for `solver`, importing its module only now.
+    With `asynchronous=True`, return the coroutine function variant instead.
+    """
+    from functools import partial
+    from importlib import import_module
+
+    if solver not in _BACKENDS:
+        raise ValueError(f"Unknown solver: {solver}")
+    module_name, kwargs = _BACKENDS[solver]
+    module = import_module(f".{module_name}", __package__)
+    if module_name == "conda":
+        kwargs = {**kwargs, "isolated": isolated}
+    return partial(module.solve_async if asynchronous else module.solve, **kwargs)
 
 
 def solve(
@@ -67,12 +351,522 @@ def solve(
     specs: list[str],
     channels: list[str],
     subdirs: tuple[str, str],
+    virtual_packages: "Sequence[VirtualPackage] | None" = None,
+    **options,
 ) -> list[str]:
-    solver_func = solver_to_callable(solver)
-    return solver_func(specs=specs, channels=channels, subdirs=subdirs)
+    """
+    Solve with the given backend. `options` are forwarded to solver_to_callable();
+    e.g. `isolated=True` runs the conda solvers in a subprocess. The virtual packages
+    are detected for `subdirs` unless given.
+    """
+    from .virtual import for_subdirs
+
+    if virtual_packages is None:
+        virtual_packages = for_subdirs(subdirs)
+    solver_func = solver_to_callable(solver, **options)
+    return solver_func(
+        specs=specs, channels=channels, subdirs=subdirs, virtual_packages=virtual_packages
+    )
+
+
+async def solve_async(
+    solver: str,
+    specs: list[str],
+    channels: list[str],
+    subdirs: tuple[str, str],
+    virtual_packages: "Sequence[VirtualPackage] | None" = None,
+    **options,
+) -> list[Record]:
+    """
+    Like solve(), but awaitable. External tools run through asyncio subprocesses, rattler
+    is awaited directly and the other in-process backends run in a worker thread.
+    """
+    from .virtual import for_subdirs
+
+    if virtual_packages is None:
+        virtual_packages = for_subdirs(subdirs)
+    solver_func = solver_to_callable(solver, asynchronous=True, **options)
+    return await solver_func(
+        specs=specs, channels=channels, subdirs=subdirs, virtual_packages=virtual_packages
+    )
+
+
+def _kill_tree(pid: int) -> None:
+    if sys.platform == "win32":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True)
+        return
+    import signal
+
+    try:
+        # Started with start_new_session=True, so the process group is the whole tree
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _remaining(deadline: float | None) -> float | None:
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+
+def run_command(argv: list[str], env: dict[str, str] | None = None) -> tuple[int, str, str]:
+    """
+    Run `argv`, with `env` on top of this environment, and return its exit code, stdout and
+    stderr. Past the deadline of the current solve, the process and all its children are
+    killed and SolveTimeout raised.
+    """
+    children = _CHILDREN.get()
+    deadline = _DEADLINE.get()
+    reap = children is not None and hasattr(os, "wait4")
+    windows = children is not None and sys.platform == "win32"
+    if children is not None and not (reap or windows):
+        # Resource usage of this child is unknown; do not report ours instead
+        children["count"] += 1
+        children["peak_rss_mb"] = None
+
+    expired = threading.Event()
+    with subprocess.Popen(
+        argv,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=None if env is None else {**os.environ, **env},
+        start_new_session=deadline is not None,
+    ) as proc:
+        timer = None
+        if deadline is not None:
+
+            def kill():
+                expired.set()
+                _kill_tree(proc.pid)
+
+            timer = threading.Timer(_remaining(deadline), kill)
+            timer.start()
+        try:
+            if reap:
+                # Reap the child with wait4() ourselves to get its own resource usage
+                stderr = []
+                reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()))
+                reader.start()
+                stdout = proc.stdout.read()
+                reader.join()
+                _, status, rusage = os.wait4(proc.pid, 0)
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                stderr = stderr[0]
+            else:
+                stdout, stderr = proc.communicate()
+            if windows:
+                # The handle of the exited child is open until the Popen object goes away
+                peak_rss, user, system = _windows_usage(int(proc._handle))
+        except BaseException:
+            if deadline is not None:
+                _kill_tree(proc.pid)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+    if reap:
+        peak_rss, user, system = _maxrss_mib(rusage.ru_maxrss), rusage.ru_utime, rusage.ru_stime
+    if reap or windows:
+        children["count"] += 1
+        children["user_seconds"] += user
+        children["system_seconds"] += system
+        if children["peak_rss_mb"] is not None:
+            children["peak_rss_mb"] = max(children["peak_rss_mb"], peak_rss)
+    if expired.is_set():
+        raise SolveTimeout()
+    return proc.returncode, stdout, stderr
+
 
+async def run_command_async(
+    argv: list[str], env: dict[str, str] | None = None
+) -> tuple[int, str, str]:
+    import asyncio
 
-def report(records_or_error: list[Record] | SolutionNotFound):
+    deadline = _DEADLINE.get()
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=None if env is None else {**os.environ, **env},
+        start_new_session=deadline is not None,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), _remaining(deadline))
+    except TimeoutError:
+        _kill_tree(proc.pid)
+        await proc.wait()
+        raise SolveTimeout() from None
+    return proc.returncode, stdout.decode(), stderr.decode()
+
+
+# In-process solvers that have run in this process; see timed_solve()
+_HOSTED: set[str] = set()
+
+
+def _in_process(solver: str, isolated: bool = False) -> bool:
+    module_name = _BACKENDS[solver][0]
+    return module_name in ("libmambapy", "rattler") or (module_name == "conda" and not isolated)
+
+
+def _import_backend(solver: str, **options) -> None:
+    solver_to_callable(solver, **options)
+
+
+class _Workers:
+    """
+    Single-process pools that run the in-process backends when a solve has a timeout,
+    since only a process can be stopped in the middle of a solve. Idle ones are kept by
+    solver and options, so their backend state stays warm between solves; one that times
+    out is terminated instead. Spawning a worker counts against the deadline of the solve.
+    """
+
+    def __init__(self):
+        self._idle: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def worker(self, solver: str, options: dict, deadline: float):
+        key = (solver, tuple(sorted(options.items())))
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            pool = idle.pop() if idle else None
+        if pool is None:
+            from multiprocessing import get_context
+
+            with phase("spawn"):
+                pool = get_context("spawn").Pool(1)
+                try:
+                    warm_up = pool.apply_async(_import_backend, (solver,), options)
+                    warm_up.get(_remaining(deadline))
+                except BaseException:
+                    pool.terminate()
+                    raise
+        try:
+            yield pool
+        except BaseException:
+            pool.terminate()
+            raise
+        with self._lock:
+            self._idle[key].append(pool)
+
+
+_WORKERS = _Workers()
+
+
+def _solve_in_worker(
+    solver: str,
+    specs: list[str],
+    channels: list[str],
+    subdirs: tuple[str, str],
+    timeout: float,
+    virtual_packages: "Sequence[VirtualPackage]",
+    **options,
+) -> "SolveResult":
+    from multiprocessing import TimeoutError
+
+    deadline = time.monotonic() + timeout
+    try:
+        with _WORKERS.worker(solver, options, deadline) as pool:
+            job = pool.apply_async(
+                timed_solve,
+                (solver, specs, channels, subdirs),
+                {**options, "virtual_packages": virtual_packages},
+            )
+            return job.get(_remaining(deadline))
+    except TimeoutError:
+        raise SolveTimeout() from None
+
+
+@dataclass
+class SolveResult:
+    solver: str
+    # Lists of records from the backends are stored as a Solution
+    outcome: Solution | SolutionNotFound | SolveTimeout
+    seconds: float
+    phases: dict[str, float] = field(default_factory=dict)
+    # peak_rss_mb, user_seconds and system_seconds; see resource_usage()
+    resources: dict[str, float] = field(default_factory=dict)
+    # "hit" or "miss" when a SolveCache was used, and the seconds a hit saved
+    cache: str | None = None
+    saved: float = 0.0
+    # .solv files loaded (hit), built (miss) or rebuilt (invalid); see count_solv_cache()
+    solv_cache: dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not isinstance(self.outcome, Solution | SolutionNotFound | SolveTimeout):
+            self.outcome = Solution(self.outcome)
+
+    @property
+    def status(self) -> str:
+        if isinstance(self.outcome, SolutionNotFound):
+            return "unsolvable"
+        if isinstance(self.outcome, SolveTimeout):
+            return "timeout"
+        return "solved"
+
+    @property
+    def exit_code(self) -> int:
+        return {"solved": 0, "unsolvable": 1, "timeout": EXIT_TIMEOUT}[self.status]
+
+    def to_dict(self) -> dict:
+        data = {
+            "solver": self.solver,
+            "status": self.status,
+            "exit_code": self.exit_code,
+            "seconds": self.seconds,
+            "phases": self.phases,
+            "resources": self.resources,
+        }
+        if self.cache:
+            data["cache"] = self.cache
+            data["saved_seconds"] = self.saved
+        if self.solv_cache:
+            data["solv_cache"] = self.solv_cache
+        if isinstance(self.outcome, SolutionNotFound | SolveTimeout):
+            data["error"] = str(self.outcome)
+        else:
+            data["records"] = [asdict(record) for record in self.outcome]
+        return data
+
+
+def timed_solve(
+    solver: str,
+    specs: list[str],
+    channels: list[str],
+    subdirs: tuple[str, str],
+    cache: "SolveCache | None" = None,
+    snapshot: str | None = None,
+    timeout: float | None = None,
+    virtual_packages: "Sequence[VirtualPackage] | None" = None,
+    **options,
+) -> SolveResult:
+    """
+    Solve and time it. With `timeout` (seconds), subprocess backends are killed with all
+    their children once it expires, and in-process backends run in a worker process that
+    is terminated; either way the outcome is a SolveTimeout. The virtual packages are
+    detected before the clock starts unless given; see virtual.detect().
+    """
+    from .virtual import for_subdirs
+
+    if virtual_packages is None:
+        virtual_packages = for_subdirs(subdirs)
+    if snapshot is not None:
+        from .snapshot import local_channels, restore_channels
+
+        original_channels, channels = channels, local_channels(snapshot, channels)
+    phases = {}
+    resources = {}
+    solv_cache = {}
+    token = _PHASES.set(phases)
+    solv_token = _SOLV_CACHE.set(solv_cache)
+    t0 = time.perf_counter()
+    key = entry = None
+    try:
+        if cache is not None:
+            key, entry = cache.lookup(solver, specs, channels, subdirs, virtual_packages)
+        if entry is not None:
+            outcome = entry.outcome
+        elif timeout is not None and _in_process(solver, **options):
+            result = _solve_in_worker(
+                solver, specs, channels, subdirs, timeout, virtual_packages, **options
+            )
+            outcome = result.outcome
+            phases.update(result.phases)
+            resources.update(result.resources)
+            solv_cache.update(result.solv_cache)
+        else:
+            # The peak RSS of a process that also hosted other solvers (with --sequential,
+            # batch or serve) includes their indexes, so it says nothing about this one
+            shared = False
+            if _in_process(solver, **options):
+                shared = bool(_HOSTED - {solver})
+                _HOSTED.add(solver)
+            deadline = _DEADLINE.set(None if timeout is None else time.monotonic() + timeout)
+            try:
+                with resource_usage(resources):
+                    outcome = solve(
+                        solver=solver,
+                        specs=specs,
+                        channels=channels,
+                        subdirs=subdirs,
+                        virtual_packages=virtual_packages,
+                        **options,
+                    )
+            finally:
+                _DEADLINE.reset(deadline)
+                if shared:
+                    resources.pop("peak_rss_mb", None)
+    except SolutionNotFound as exc:
+        outcome = exc
+    except SolveTimeout:
+        outcome = SolveTimeout(f"{solver} did not finish within {timeout:g}s")
+    finally:
+        seconds = time.perf_counter() - t0
+        _PHASES.reset(token)
+        _SOLV_CACHE.reset(solv_token)
+    if snapshot is not None:
+        outcome = restore_channels(outcome, channels, original_channels)
+    result = SolveResult(
+        solver=solver,
+        outcome=outcome,
+        seconds=seconds,
+        phases=phases,
+        resources=resources,
+        solv_cache=solv_cache,
+    )
+    # A timeout says nothing about the request; the next solve may get further
+    if key is not None and not isinstance(outcome, SolveTimeout):
+        cache.update(key, result, entry)
+    return result
+
+
+def solve_all(
+    solvers: list[str],
+    specs: list[str],
+    channels: list[str],
+    subdirs: tuple[str, str],
+    parallel: bool = True,
+    ordered: bool = True,
+    **options,
+) -> Iterator[SolveResult]:
+    """
+    Solve the same request with several solvers, yielding results in the order of `solvers`,
+    or as soon as each one finishes with `ordered=False`.
+
+    In parallel mode, each solve runs in its own worker process so the in-process backends
+    do not compete for the GIL. Timings are measured inside the worker. The virtual
+    packages are detected once, here, so all the solvers get the same ones.
+    """
+    from .virtual import for_subdirs
+
+    options.setdefault("virtual_packages", for_subdirs(subdirs))
+    if not parallel or len(solvers) < 2:
+        for solver in solvers:
+            yield timed_solve(solver, specs, channels, subdirs, **options)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from multiprocessing import get_context
+
+    with ProcessPoolExecutor(max_workers=len(solvers), mp_context=get_context("spawn")) as pool:
+        futures = [
+            pool.submit(timed_solve, solver, specs, channels, subdirs, **options)
+            for solver in solvers
+        ]
+        for future in futures if ordered else as_completed(futures):
+            yield future.result()
+
+
+async def timed_solve_async(
+    solver: str,
+    specs: list[str],
+    channels: list[str],
+    subdirs: tuple[str, str],
+    cache: "SolveCache | None" = None,
+    snapshot: str | None = None,
+    timeout: float | None = None,
+    virtual_packages: "Sequence[VirtualPackage] | None" = None,
+    **options,
+) -> SolveResult:
+    import asyncio
+
+    from .virtual import for_subdirs
+
+    if virtual_packages is None:
+        virtual_packages = for_subdirs(subdirs)
+    if snapshot is not None:
+        from .snapshot import local_channels, restore_channels
+
+        original_channels, channels = channels, local_channels(snapshot, channels)
+    # Each asyncio task runs in its own copy of the context, so concurrent solves
+    # do not mix their phases
+    phases = {}
+    solv_cache = {}
+    token = _PHASES.set(phases)
+    solv_token = _SOLV_CACHE.set(solv_cache)
+    t0 = time.perf_counter()
+    key = entry = None
+    try:
+        if cache is not None:
+            # Checking the repodata state is blocking network I/O
+            key, entry = await asyncio.to_thread(
+                cache.lookup, solver, specs, channels, subdirs, virtual_packages
+            )
+        if entry is not None:
+            outcome = entry.outcome
+        elif timeout is not None and _in_process(solver, **options):
+            result = await asyncio.to_thread(
+                _solve_in_worker,
+                solver,
+                specs,
+                channels,
+                subdirs,
+                timeout,
+                virtual_packages,
+                **options,
+            )
+            outcome = result.outcome
+            phases.update(result.phases)
+            solv_cache.update(result.solv_cache)
+        else:
+            deadline = _DEADLINE.set(None if timeout is None else time.monotonic() + timeout)
+            try:
+                outcome = await solve_async(
+                    solver=solver,
+                    specs=specs,
+                    channels=channels,
+                    subdirs=subdirs,
+                    virtual_packages=virtual_packages,
+                    **options,
+                )
+            finally:
+                _DEADLINE.reset(deadline)
+    except SolutionNotFound as exc:
+        outcome = exc
+    except SolveTimeout:
+        outcome = SolveTimeout(f"{solver} did not finish within {timeout:g}s")
+    finally:
+        seconds = time.perf_counter() - t0
+        _PHASES.reset(token)
+        _SOLV_CACHE.reset(solv_token)
+    if snapshot is not None:
+        outcome = restore_channels(outcome, channels, original_channels)
+    result = SolveResult(
+        solver=solver, outcome=outcome, seconds=seconds, phases=phases, solv_cache=solv_cache
+    )
+    if key is not None and not isinstance(outcome, SolveTimeout):
+        await asyncio.to_thread(cache.update, key, result, entry)
+    return result
+
+
+async def solve_many_async(
+    jobs: Iterable[tuple[str, list[str], list[str], tuple[str, str] | None]],
+    concurrency: int | None = None,
+    **options,
+) -> list[SolveResult]:
+    """
+    Run many (solver, specs, channels, subdirs) jobs concurrently, with at most
+    `concurrency` of them in flight. Results are returned in the order of `jobs`.
+    Timings are wall-clock times of each job while sharing the loop with the others;
+    resource usage is not measured, since all the jobs share this process.
+    """
+    import asyncio
+
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def run(job) -> SolveResult:
+        if semaphore is None:
+            return await timed_solve_async(*job, **options)
+        async with semaphore:
+            return await timed_solve_async(*job, **options)
+
+    return await asyncio.gather(*(run(job) for job in jobs))
+
+
+def report(records_or_error: list[Record] | SolutionNotFound | SolveTimeout):
+    if isinstance(records_or_error, SolveTimeout):
+        print(f"\n⌛ Gave up: {records_or_error}")
+        return
     if isinstance(records_or_error, SolutionNotFound):
         print("\n💥🧨💥 Oops! Could not find a solution. This is what the solver said:\n")
         print(str(records_or_error))
@@ -81,6 +875,23 @@ def report(records_or_error: list[Record] | SolutionNotFound):
     print(*sorted(records_or_error), sep="\n")
 
 
+def format_phases(phases: dict[str, float]) -> str:
+    return ", ".join(f"{name} {seconds:.3f}s" for name, seconds in phases.items())
+
+
+def format_resources(resources: dict[str, float]) -> str:
+    cpu = f"CPU {resources['user_seconds']:.3f}s user + {resources['system_seconds']:.3f}s system"
+    if "peak_rss_mb" in resources:
+        return f"peak RSS {resources['peak_rss_mb']:.1f} MiB, {cpu}"
+    return cpu
+
+
+def format_solv_cache(solv_cache: dict[str, int]) -> str:
+    return ".solv files: " + ", ".join(
+        f"{count} {outcome}" for outcome, count in solv_cache.items()
+    )
+
+
 def color_diff(*lines: str):
     from colorama import Fore, init
 
@@ -92,5 +903,7 @@ def color_diff(*lines: str):
             yield Fore.RED + line + Fore.RESET
         elif line.startswith("?"):
             yield Fore.BLUE + line + Fore.RESET
+        elif line.startswith("~"):
+            yield Fore.YELLOW + line + Fore.RESET
         else:
             yield line
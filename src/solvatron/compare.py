@@ -0,0 +1,116 @@
+"""
+Structural comparison of solutions, keyed by package name.
+"""
+
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+
+from .common import Record, Solution
+
+# Kinds of change, from the most to the least relevant one
+CHANGE_KINDS: tuple[str, ...] = ("added", "removed", "version", "build", "channel")
+
+
+@dataclass(frozen=True)
+class Change:
+    name: str
+    kind: str
+    old: Record | None
+    new: Record | None
+
+    def __str__(self):
+        if self.kind == "removed":
+            return f"- {self.old}"
+        if self.kind == "added":
+            return f"+ {self.new}"
+        if self.kind == "channel":
+            return (
+                f"~ {self.name}: {self.old.channel}/{self.old.subdir} "
+                f"vs {self.new.channel}/{self.new.subdir}"
+            )
+        return (
+            f"~ {self.name}: {self.old.version}-{self.old.build} "
+            f"vs {self.new.version}-{self.new.build}"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "old": str(self.old) if self.old else None,
+            "new": str(self.new) if self.new else None,
+        }
+
+
+def _identical(solutions: list[Iterable[Record]]) -> bool:
+    # Solutions compare their id arrays, without building any Record
+    return isinstance(solutions[0], Solution) and all(
+        solutions[0] == other for other in solutions[1:]
+    )
+
+
+def _by_name(records: Iterable[Record]) -> dict[str, Record]:
+    return {record.name: record for record in records}
+
+
+def classify(old: Record | None, new: Record | None) -> str | None:
+    """
+    Return the kind of change between two records of the same package, if any.
+    """
+    if old is None:
+        return "added"
+    if new is None:
+        return "removed"
+    if old.version != new.version:
+        return "version"
+    if old.build != new.build:
+        return "build"
+    if old.channel != new.channel or old.subdir != new.subdir:
+        return "channel"
+    return None
+
+
+def diff(old: Iterable[Record], new: Iterable[Record]) -> list[Change]:
+    """
+    Compare two solutions package by package. Matching is done with a dict lookup per
+    name, so this is linear in the size of the solutions (plus sorting the names).
+    """
+    if _identical([old, new]):
+        return []
+    old_by_name, new_by_name = _by_name(old), _by_name(new)
+    changes = []
+    for name in sorted(old_by_name.keys() | new_by_name.keys()):
+        old_record, new_record = old_by_name.get(name), new_by_name.get(name)
+        if kind := classify(old_record, new_record):
+            changes.append(Change(name, kind, old_record, new_record))
+    return changes
+
+
+def table(solutions: Mapping[str, Iterable[Record]]) -> dict[str, dict[str, Record | None]]:
+    """
+    N-way comparison: for each package that is not identical across all the solutions,
+    map each solver to its record for that package (None if absent).
+    """
+    if solutions and _identical(list(solutions.values())):
+        return {}
+    by_solver = {solver: _by_name(records) for solver, records in solutions.items()}
+    rows = {}
+    for name in sorted(set().union(*by_solver.values())):
+        row = {solver: records.get(name) for solver, records in by_solver.items()}
+        if len(set(row.values())) > 1:
+            rows[name] = row
+    return rows
+
+
+def matrix(solutions: Mapping[str, Iterable[Record]]) -> dict[str, dict[str, int]]:
+    """
+    Number of differing packages for each pair of solvers.
+    """
+    solvers = list(solutions)
+    by_solver = [list(solutions[solver]) for solver in solvers]
+    counts = {a: {b: 0 for b in solvers} for a in solvers}
+    for i, a in enumerate(solvers):
+        for j in range(i + 1, len(solvers)):
+            b = solvers[j]
+            counts[a][b] = counts[b][a] = len(diff(by_solver[i], by_solver[j]))
+    return counts
@@ -1,46 +1,149 @@
+import asyncio
 import json
 import sys
-import subprocess
+import threading
+from argparse import Namespace
+from functools import cache
+from pathlib import Path
+from tempfile import gettempdir
+from uuid import uuid4
 
-from .common import Record, SolutionNotFound
+from .common import Record, SolutionNotFound, phase, run_command, run_command_async
+from .virtual import VirtualPackage, environ, overrides
 
+# conda's context is a process-wide singleton, so in-process solves are serialized
+_LOCK = threading.Lock()
+_UNSET = object()
+_context_subdir = _UNSET
 
-def solve(specs: list[str], channels: list[str], subdirs: list[str], solver: str) -> list[Record]:
+
+def solve(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str],
+    virtual_packages: list[VirtualPackage],
+    solver: str,
+    isolated: bool = False,
+) -> list[Record]:
+    # conda detects the virtual packages itself; the overrides make it find these
+    env = overrides(virtual_packages)
+    if isolated:
+        with phase("spawn"):
+            returncode, stdout, _ = run_command(_command(specs, channels, subdirs, solver), env)
+        return _parse(returncode, stdout)
+    with _LOCK, environ(env):
+        return _solve_in_process(specs, channels, subdirs, solver)
+
+
+async def solve_async(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str],
+    virtual_packages: list[VirtualPackage],
+    solver: str,
+    isolated: bool = False,
+) -> list[Record]:
+    if isolated:
+        with phase("spawn"):
+            returncode, stdout, _ = await run_command_async(
+                _command(specs, channels, subdirs, solver), overrides(virtual_packages)
+            )
+        return _parse(returncode, stdout)
+    return await asyncio.to_thread(solve, specs, channels, subdirs, virtual_packages, solver)
+
+
+@cache
+def _dry_run_prefix() -> str:
+    # Never created, so there is nothing to clean up; the solver only needs a path that
+    # does not hold an environment
+    return str(Path(gettempdir(), f"solvatron-conda-{uuid4().hex}", "env"))
+
+
+def _setup_context(subdir: str | None):
+    global _context_subdir
+
+    from conda.base.context import context
+
+    # Only reload the configuration when the target platform changes
+    if subdir != _context_subdir:
+        context.__init__(
+            argparse_args=Namespace(subdir=subdir, json=True, quiet=True, dry_run=True)
+        )
+        _context_subdir = subdir
+    return context
+
+
+def _solve_in_process(
+    specs: list[str], channels: list[str], subdirs: list[str] | None, solver: str
+) -> list[Record]:
+    platform = next((s for s in subdirs if s != "noarch"), None) if subdirs else None
+    with phase("setup"):
+        from conda.exceptions import CondaError
+        from conda.models.match_spec import MatchSpec
+
+        context = _setup_context(platform)
+        solver_backend = context.plugin_manager.get_solver_backend(solver)
+    with phase("solve"):
+        try:
+            records = solver_backend(
+                _dry_run_prefix(),
+                channels,
+                subdirs=context.subdirs,
+                specs_to_add=[MatchSpec(spec) for spec in specs],
+            ).solve_final_state()
+        except CondaError as exc:
+            raise SolutionNotFound(str(exc))
+    with phase("convert"):
+        return [
+            Record(
+                name=r.name,
+                version=r.version,
+                build=r.build,
+                channel=r.channel.canonical_name,
+                subdir=r.subdir,
+            )
+            for r in records
+            # virtual packages are part of the final state, but never linked
+            if not r.name.startswith("__")
+        ]
+
+
+def _command(specs: list[str], channels: list[str], subdirs: list[str], solver: str) -> list[str]:
     if subdirs:
         platform = (f"--platform={next(s for s in subdirs if s != 'noarch')}",)
     else:
         platform = ()
-    p = subprocess.run(
-        [
-            sys.executable,
-            "-m",
-            "conda",
-            "create",
-            "--dry-run",
-            "--json",
-            f"--solver={solver}",
-            "--override-channels",
-            *([f"--channel={c}" for c in channels]),
-            *platform,
-            *specs,
-        ],
-        capture_output=True,
-        text=True,
-    )
-    data = json.loads(p.stdout)
-    if p.returncode:
-        raise SolutionNotFound(data["message"])
-    items = []
-    for r in data["actions"]["LINK"]:
-        if not r:
-            continue
-        items.append(
-            Record(
-                name=r["name"],
-                version=r["version"],
-                build=r["build_string"],
-                channel=r["channel"],
-                subdir=r["platform"],
+    return [
+        sys.executable,
+        "-m",
+        "conda",
+        "create",
+        "--dry-run",
+        "--json",
+        f"--solver={solver}",
+        "--override-channels",
+        *([f"--channel={c}" for c in channels]),
+        *platform,
+        *specs,
+    ]
+
+
+def _parse(returncode: int, stdout: str) -> list[Record]:
+    with phase("parse"):
+        data = json.loads(stdout)
+        if returncode:
+            raise SolutionNotFound(data["message"])
+        items = []
+        for r in data["actions"]["LINK"]:
+            if not r:
+                continue
+            items.append(
+                Record(
+                    name=r["name"],
+                    version=r["version"],
+                    build=r["build_string"],
+                    channel=r["channel"],
+                    subdir=r["platform"],
+                )
             )
-        )
-    return items
+        return items
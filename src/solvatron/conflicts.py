@@ -0,0 +1,150 @@
+"""
+Find a minimal set of conflicting specs in an unsolvable request with delta debugging
+(Zeller's ddmin), testing the candidate subsets of each round in parallel.
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from .cli import ArgumentError, subdirs_for_platform
+from .common import SolutionNotFound, format_phases, report, solver_to_callable, timed_solve
+from .snapshot import local_channels
+from .virtual import for_subdirs
+
+
+def _split(specs: list[str], n: int) -> list[list[str]]:
+    size, extra = divmod(len(specs), n)
+    chunks, start = [], 0
+    for i in range(n):
+        end = start + size + (i < extra)
+        chunks.append(specs[start:end])
+        start = end
+    return chunks
+
+
+def minimize(specs: list[str], unsolvable: Callable[[list[list[str]]], list[bool]]) -> list[str]:
+    """
+    Reduce the unsolvable `specs` to a 1-minimal unsolvable subset: removing any single
+    spec from it makes it solvable. `unsolvable` tests several subsets at once, so each
+    round's chunks and complements can be solved in parallel.
+    """
+    n = 2
+    while len(specs) >= 2:
+        chunks = _split(specs, n)
+        complements = [[s for s in specs if s not in chunk] for chunk in chunks]
+        # With two chunks, the complements are the chunks themselves
+        candidates = chunks + (complements if n > 2 else [])
+        outcomes = unsolvable(candidates)
+        if True in outcomes[: len(chunks)]:
+            specs, n = chunks[outcomes.index(True)], 2
+        elif True in outcomes[len(chunks) :]:
+            specs, n = complements[outcomes[len(chunks) :].index(True)], max(n - 1, 2)
+        elif n >= len(specs):
+            break
+        else:
+            n = min(2 * n, len(specs))
+    return specs
+
+
+def _unsolvable(solver: str, specs: list[str], channels: list[str], subdirs, **options) -> bool:
+    # A subset that times out is not known to be unsolvable, so it is not reduced further
+    result = timed_solve(solver, specs, channels, subdirs, **options)
+    return isinstance(result.outcome, SolutionNotFound)
+
+
+def _import_backend(solver: str) -> None:
+    solver_to_callable(solver)
+
+
+class _Tester:
+    """
+    Tests subsets of specs in a pool of worker processes. In-process backends keep their
+    index loaded between tests (e.g. libmambapy's Database), so after the first round each
+    test only pays for the solve itself. Results are memoized by subset.
+    """
+
+    def __init__(self, pool: ProcessPoolExecutor, solver: str, channels, subdirs, **options):
+        self.pool = pool
+        self.job = (solver, channels, subdirs)
+        self.options = options
+        self.results: dict[frozenset[str], bool] = {}
+
+    def __call__(self, candidates: list[list[str]]) -> list[bool]:
+        solver, channels, subdirs = self.job
+        futures = {
+            key: self.pool.submit(
+                _unsolvable, solver, candidate, channels, subdirs, **self.options
+            )
+            for candidate in candidates
+            if (key := frozenset(candidate)) not in self.results
+        }
+        for key, future in futures.items():
+            self.results[key] = future.result()
+        outcomes = [self.results[frozenset(candidate)] for candidate in candidates]
+        print(
+            f"🔎 {len(candidates)} subsets of {max(map(len, candidates))} specs or less: "
+            f"{outcomes.count(True)} unsolvable",
+            flush=True,
+        )
+        return outcomes
+
+
+def main(args: argparse.Namespace) -> int:
+    if len(args.specs) < 2:
+        raise ArgumentError("Two or more specs are required.")
+    if not args.solver or len(args.solver) != 1:
+        raise ArgumentError("Exactly one solver is required.")
+    if not args.channel:
+        raise ArgumentError("One or more channels are required.")
+    if args.jobs < 1:
+        raise ArgumentError("--jobs must be at least 1.")
+    if args.snapshot:
+        local_channels(args.snapshot, args.channel)
+    (solver,) = args.solver
+    subdirs = subdirs_for_platform(args.platform)
+    options = {
+        "isolated": args.isolated,
+        "snapshot": args.snapshot,
+        "timeout": args.timeout,
+        "virtual_packages": for_subdirs(subdirs),
+    }
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=args.jobs,
+        mp_context=get_context("spawn"),
+        initializer=_import_backend,
+        initargs=(solver,),
+    ) as pool:
+        tester = _Tester(pool, solver, args.channel, subdirs, **options)
+        full = pool.submit(timed_solve, solver, args.specs, args.channel, subdirs, **options)
+        full = full.result()
+        if full.status == "solved":
+            print(f"✨ The request is solvable with {solver}; nothing to minimize.")
+            return 0
+        if full.status == "timeout":
+            report(full.outcome)
+            return full.exit_code
+        tester.results[frozenset(args.specs)] = True
+        specs = minimize(args.specs, tester)
+        explanation = pool.submit(
+            timed_solve, solver, specs, args.channel, subdirs, **options
+        ).result()
+
+    print()
+    print(f"💥 Minimal conflicting specs ({len(specs)} of {len(args.specs)}):")
+    print()
+    print(*(f"  {spec}" for spec in specs), sep="\n")
+    print()
+    print(f"This is what {solver} says about them:")
+    print()
+    print(str(explanation.outcome))
+    print()
+    print(
+        f"⏱️  {len(tester.results)} solves in {time.perf_counter() - t0:.3f}s; last one: "
+        f"{explanation.seconds:.3f}s ({format_phases(explanation.phases)})"
+    )
+    return 1
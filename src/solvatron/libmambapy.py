@@ -1,11 +1,16 @@
+import asyncio
 import os
-import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import cache
 from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+from urllib.request import url2pathname
 
 from conda.base.context import context
-from conda.core.index import Index
 from conda.core.subdir_data import SubdirData
+from conda.gateways.repodata import RepodataState
 from conda.models.channel import Channel
 from libmambapy import Context, ContextOptions, Repo
 from libmambapy.solver import ProblemsMessageFormat, Request, Solution
@@ -21,53 +26,186 @@ from libmambapy.solver.libsolv import Solver as LibsolvSolver
 from libmambapy.specs import (
     ChannelResolveParams,
     CondaURL,
+    NoArchType,
     PackageInfo,
 )
 from libmambapy.specs import MatchSpec as LibmambaMatchSpec
 
-from .common import Record, SolutionNotFound
+from .common import Record, SolutionNotFound, count_solv_cache, phase, spec_name
+from .snapshot import subdir_digest
+from .virtual import VirtualPackage
 
+if TYPE_CHECKING:
+    from . import shards
 
-def _load_channel(db: Database, channel: str, subdir: str) -> Repo:
+_LOCK = threading.Lock()
+
+# Maximum number of databases kept around for reuse; each holds whole channels in memory
+MAX_DATABASES = 4
+
+# (channels, subdirs, sharded) -> (fingerprint, database), least recently used first;
+# see setup_database()
+_DATABASES: OrderedDict[tuple[tuple[str, ...], tuple[str, ...], bool], tuple[tuple, Database]] = (
+    OrderedDict()
+)
+
+
+class _FetchedRepodata(NamedTuple):
+    channel_id: str
+    channel: Channel
+    json_path: Path
+    state: RepodataState
+
+
+class _ShardedRepodata(NamedTuple):
+    channel_id: str
+    url: str
+    index: "shards.ShardIndex"
+    # name -> shard
+    shards: dict[str, dict]
+
+
+def _fetch_channel(channel: str, subdir: str) -> _FetchedRepodata:
     channel_id = f"{channel}/{subdir}"
     channel_obj = Channel(channel_id)
     sd = SubdirData(channel=channel_obj)
     json_path, state = sd.repo_fetch.fetch_latest_path()
-    json_path = Path(json_path)
-    solv_path = json_path.with_suffix(".solv")
+    return _FetchedRepodata(channel_id, channel_obj, Path(json_path), state)
 
-    try_solv = sys.platform == "win32"
-    if try_solv:
-        repodata_origin = RepodataOrigin(url=channel_obj.url(), etag=state.etag, mod=state.mod)
+
+def _load_channel(db: Database, fetched: _FetchedRepodata) -> Repo:
+    channel_id, channel_obj, json_path, state = fetched
+    # The .solv file lives next to conda's repodata cache and is validated against
+    # the origin it was serialized from. Local channels may not report etag/mod,
+    # so fall back to the cached JSON mtime.
+    solv_path = json_path.with_suffix(".solv")
+    etag, mod = state.etag or "", state.mod or ""
+    if not (etag or mod):
+        mod = str(json_path.stat().st_mtime_ns)
+    repodata_origin = RepodataOrigin(url=channel_obj.url(), etag=etag, mod=mod)
+    writable = True
+    if channel_obj.url().startswith("file://"):
+        local = Path(url2pathname(channel_obj.url()[len("file://") :]))
+        if snapshot := subdir_digest(local):
+            # Snapshots ship their own .solv, validated against where the subdir is in the
+            # snapshot and the digest in its manifest, so it survives copying the snapshot
+            # elsewhere. It may be read-only, so its files are never rewritten.
+            solv_path, repodata_origin = Path(local, "repodata.solv"), _snapshot_origin(*snapshot)
+            writable = False
+    add_pip_as_python_dependency = PipAsPythonDependency(context.add_pip_as_python_dependency)
+    if solv_path.is_file():
         try:
-            return db.add_repo_from_native_serialization(
+            repo = db.add_repo_from_native_serialization(
                 path=str(solv_path),
                 expected=repodata_origin,
                 channel_id=channel_id,
-                add_pip_as_python_dependency=PipAsPythonDependency(
-                    context.add_pip_as_python_dependency
-                ),
+                add_pip_as_python_dependency=add_pip_as_python_dependency,
             )
         except Exception:
-            pass
+            # Stale, corrupt or written by another libsolv version; rebuild it below
+            count_solv_cache("invalid")
+            if writable:
+                solv_path.unlink(missing_ok=True)
+        else:
+            count_solv_cache("hit")
+            return repo
+    else:
+        count_solv_cache("miss")
     repo = db.add_repo_from_repodata_json(
         path=str(json_path),
         url=channel_obj.url(),
         channel_id=channel_id,
-        add_pip_as_python_dependency=PipAsPythonDependency(context.add_pip_as_python_dependency),
-        package_types=(
-            PackageTypes.TarBz2Only if context.use_only_tar_bz2 else PackageTypes.CondaOrElseTarBz2
-        ),
+        add_pip_as_python_dependency=add_pip_as_python_dependency,
+        package_types=_package_types(),
     )
-    if try_solv:
-        db.native_serialize_repo(
-            repo=repo,
-            path=str(solv_path),
-            metadata=repodata_origin,
-        )
+    if not writable:
+        return repo
+    # Write to a temporary file first so concurrent or interrupted runs never leave a
+    # partially written .solv behind
+    tmp_path = solv_path.with_name(f"{solv_path.name}.{os.getpid()}.tmp")
+    try:
+        db.native_serialize_repo(repo=repo, path=str(tmp_path), metadata=repodata_origin)
+        os.replace(tmp_path, solv_path)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
     return repo
 
 
+_NOARCH_TYPES = {"generic": NoArchType.Generic, "python": NoArchType.Python}
+
+
+def _package_info(filename: str, record: dict, sharded: _ShardedRepodata) -> PackageInfo:
+    track_features = record.get("track_features") or []
+    if isinstance(track_features, str):
+        track_features = track_features.replace(",", " ").split()
+    # Same normalization as libmamba's repodata.json parser: some timestamps are in ms
+    timestamp = record.get("timestamp", 0)
+    if timestamp > 253402300799:
+        timestamp //= 1000
+    return PackageInfo(
+        name=record["name"],
+        version=record["version"],
+        build_string=record["build"],
+        build_number=record.get("build_number", 0),
+        channel=sharded.channel_id,
+        package_url=sharded.index.package_url(filename),
+        platform=record.get("subdir", sharded.channel_id.rsplit("/", 1)[-1]),
+        filename=filename,
+        license=record.get("license") or "",
+        md5=record.get("md5") or "",
+        sha256=record.get("sha256") or "",
+        track_features=track_features,
+        dependencies=record.get("depends", []),
+        constrains=record.get("constrains", []),
+        noarch=_NOARCH_TYPES.get(record.get("noarch"), NoArchType.No),
+        size=record.get("size", 0),
+        timestamp=timestamp,
+    )
+
+
+def _load_shards(db: Database, sharded: _ShardedRepodata) -> Repo:
+    from . import shards
+
+    return db.add_repo_from_packages(
+        packages=[
+            _package_info(filename, record, sharded)
+            for shard in sharded.shards.values()
+            for filename, record in shards.records(shard, context.use_only_tar_bz2).items()
+        ],
+        # Named like the repos loaded from repodata.json, for _setup_priorities()
+        name=sharded.url,
+        add_pip_as_python_dependency=PipAsPythonDependency(context.add_pip_as_python_dependency),
+    )
+
+
+def _package_types() -> PackageTypes:
+    return PackageTypes.TarBz2Only if context.use_only_tar_bz2 else PackageTypes.CondaOrElseTarBz2
+
+
+def _snapshot_origin(relative: str, digest: str) -> RepodataOrigin:
+    return RepodataOrigin(url=f"snapshot:{relative}", etag=digest, mod="")
+
+
+def write_snapshot_solv(subdir_path: Path, relative: str, digest: str) -> None:
+    """
+    Serialize the repodata.json of a snapshot subdir to repodata.solv next to it. See
+    snapshot.subdir_digest() for `relative` and `digest`.
+    """
+    db = Database(_channel_params([subdir_path.name]))
+    repo = db.add_repo_from_repodata_json(
+        path=str(Path(subdir_path, "repodata.json")),
+        url=subdir_path.resolve().as_uri(),
+        channel_id=subdir_path.resolve().as_uri(),
+        add_pip_as_python_dependency=PipAsPythonDependency(context.add_pip_as_python_dependency),
+        package_types=_package_types(),
+    )
+    db.native_serialize_repo(
+        repo=repo,
+        path=str(Path(subdir_path, "repodata.solv")),
+        metadata=_snapshot_origin(relative, digest),
+    )
+
+
 def _setup_priorities(db: Database, repos: list[Repo]) -> None:
     has_priority = True
 
@@ -98,8 +236,8 @@ def _setup_priorities(db: Database, repos: list[Repo]) -> None:
         db.set_repo_priority(repo, Priorities(priority, subpriority))
 
 
-def setup_database(channels: list[str], subdirs: tuple[str, str]) -> Database:
-    params = ChannelResolveParams(
+def _channel_params(subdirs: list[str]) -> ChannelResolveParams:
+    return ChannelResolveParams(
         platforms=set(subdirs),
         channel_alias=CondaURL.parse("https://conda.anaconda.org"),
         custom_channels=ChannelResolveParams.ChannelMap({}),
@@ -107,28 +245,132 @@ def setup_database(channels: list[str], subdirs: tuple[str, str]) -> Database:
         home_dir=str(Path.home()),
         current_working_dir=os.getcwd(),
     )
-    db = Database(params)
 
+
+def _build_database(
+    subdirs, fetches: list[Future], virtual_packages: list[VirtualPackage]
+) -> Database:
+    db = Database(_channel_params(subdirs))
+
+    # Load in channel order, each repo as soon as its own repodata is fetched, while
+    # the later ones are still downloading
     repos = []
-    for channel in channels:
-        for subdir in subdirs:
-            repos.append(_load_channel(db, channel, subdir))
-
-    # Add virtual packages
-    virtual = [
-        PackageInfo(name=pkg.name, version=pkg.version, build_string=pkg.build)
-        for pkg in Index().system_packages
-    ]
-    repo = db.add_repo_from_packages(
-        packages=virtual,
-        name="virtual",
-        add_pip_as_python_dependency=PipAsPythonDependency.No,
+    for future in fetches:
+        with phase("fetch"):
+            fetched = future.result()
+        with phase("index"):
+            if isinstance(fetched, _ShardedRepodata):
+                repos.append(_load_shards(db, fetched))
+            else:
+                repos.append(_load_channel(db, fetched))
+
+    with phase("index"):
+        # Add virtual packages
+        repo = db.add_repo_from_packages(
+            packages=[
+                PackageInfo(name=pkg.name, version=pkg.version, build_string=pkg.build)
+                for pkg in virtual_packages
+            ],
+            name="virtual",
+            add_pip_as_python_dependency=PipAsPythonDependency.No,
+        )
+        repos.append(repo)
+        db.set_installed_repo(repo)
+
+        _setup_priorities(db, repos)
+    return db
+
+
+def _fingerprint(fetches: list[Future], virtual_packages: list[VirtualPackage]) -> tuple:
+    def repo_fingerprint(item: _FetchedRepodata | _ShardedRepodata) -> tuple:
+        if isinstance(item, _ShardedRepodata):
+            # Shards are content-addressed
+            return item.channel_id, tuple(sorted(item.index.shards[name] for name in item.shards))
+        return item.channel_id, item.json_path.stat().st_mtime_ns, item.state.etag, item.state.mod
+
+    return (
+        tuple(repo_fingerprint(future.result()) for future in fetches),
+        tuple(virtual_packages),
     )
-    repos.append(repo)
-    db.set_installed_repo(repo)
 
-    _setup_priorities(db, repos)
 
+def _fetch_sharded(
+    pool: ThreadPoolExecutor, specs: list[str], pairs: list[tuple[str, str]]
+) -> list[Future]:
+    """
+    Fetch the shards reachable from `specs` in the subdirs that publish sharded
+    repodata, while the others are fetched in full. The records of the latter may depend
+    on names that are only in the former, so their dependencies are followed too.
+    """
+    from . import shards
+    from .prune import dependency_names
+
+    urls = [Channel(f"{channel}/{subdir}").url() for channel, subdir in pairs]
+    with phase("fetch"):
+        indexes = list(pool.map(shards.fetch_index, urls))
+        full = {
+            pair: pool.submit(_fetch_channel, *pair)
+            for pair, index in zip(pairs, indexes)
+            if index is None
+        }
+        dependencies = {}
+        if len(full) < len(pairs):
+            for future in full.values():
+                for name, names in dependency_names(future.result().json_path).items():
+                    dependencies.setdefault(name, set()).update(names)
+        found = iter(
+            shards.closure(
+                [index for index in indexes if index is not None],
+                map(spec_name, specs),
+                dependencies=dependencies,
+            )
+        )
+    fetches = []
+    for pair, url, index in zip(pairs, urls, indexes):
+        if index is None:
+            fetches.append(full[pair])
+        else:
+            # Already fetched; a completed future so _build_database() takes both alike
+            fetches.append(Future())
+            fetches[-1].set_result(_ShardedRepodata("/".join(pair), url, index, next(found)))
+    return fetches
+
+
+def setup_database(
+    channels: list[str],
+    subdirs: tuple[str, str],
+    virtual_packages: list[VirtualPackage],
+    specs: list[str] | None = None,
+) -> Database:
+    """
+    Return a Database for the given channels and subdirs, reusing the one built by a
+    previous call in this process as long as the upstream repodata (etag/mod) and the
+    virtual packages did not change. Only the MAX_DATABASES most recently used ones are
+    kept. All subdirs are fetched concurrently.
+    With `specs`, subdirs that publish sharded repodata only contribute the records
+    reachable from them; the others are loaded in full.
+    """
+    pairs = [(channel, subdir) for channel in channels for subdir in subdirs]
+    key = (tuple(channels), tuple(subdirs), specs is not None)
+    with ThreadPoolExecutor(max_workers=context.repodata_threads or len(pairs) or 1) as pool:
+        if specs is None:
+            fetches = [pool.submit(_fetch_channel, channel, subdir) for channel, subdir in pairs]
+        else:
+            fetches = _fetch_sharded(pool, specs, pairs)
+        if cached := _DATABASES.get(key):
+            # Deciding whether the cached database is still valid takes every fetch
+            with phase("fetch"):
+                fingerprint = _fingerprint(fetches, virtual_packages)
+            if cached[0] == fingerprint:
+                _DATABASES.move_to_end(key)
+                return cached[1]
+        db = _build_database(subdirs, fetches, virtual_packages)
+
+    # Replacing the entry drops the stale database
+    _DATABASES.pop(key, None)
+    _DATABASES[key] = (_fingerprint(fetches, virtual_packages), db)
+    while len(_DATABASES) > MAX_DATABASES:
+        _DATABASES.popitem(last=False)
     return db
 
 
@@ -166,8 +408,41 @@ def process_outcome(db: Database, outcome: Solution | UnSolvable) -> list[Record
     return items
 
 
-def solve(specs: list[str], channels: list[str], subdirs: list[str] | None) -> list[Record]:
-    db = setup_database(channels, subdirs or [context.subdir, "noarch"])
+def solve(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str] | None,
+    virtual_packages: list[VirtualPackage],
+    shards: bool = False,
+) -> list[Record]:
+    # Databases are cached and shared, but libsolv is not thread-safe
+    with _LOCK:
+        return _solve(specs, channels, subdirs, virtual_packages, shards)
+
+
+async def solve_async(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str] | None,
+    virtual_packages: list[VirtualPackage],
+    shards: bool = False,
+) -> list[Record]:
+    return await asyncio.to_thread(solve, specs, channels, subdirs, virtual_packages, shards)
+
+
+def _solve(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str] | None,
+    virtual_packages: list[VirtualPackage],
+    shards: bool,
+) -> list[Record]:
+    db = setup_database(
+        channels,
+        subdirs or [context.subdir, "noarch"],
+        virtual_packages,
+        specs if shards else None,
+    )
     request = Request(
         jobs=[Request.Install(LibmambaMatchSpec.parse(spec)) for spec in specs],
         flags=Request.Flags(
@@ -180,6 +455,7 @@ def solve(specs: list[str], channels: list[str], subdirs: list[str] | None) -> l
             strict_repo_priority=True,
         ),
     )
-    solver = LibsolvSolver()
-    outcome = solver.solve(db, request)
-    return process_outcome(db, outcome)
+    with phase("solve"):
+        outcome = LibsolvSolver().solve(db, request)
+    with phase("convert"):
+        return process_outcome(db, outcome)
@@ -1,43 +1,69 @@
 import json
-import subprocess
 
-from .common import Record, SolutionNotFound
+from .common import Record, SolutionNotFound, phase, run_command, run_command_async
+from .virtual import VirtualPackage, overrides
 
 
-def solve(specs: list[str], channels: list[str], subdirs: list[str]) -> list[Record]:
+def solve(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str],
+    virtual_packages: list[VirtualPackage],
+) -> list[Record]:
+    with phase("spawn"):
+        returncode, stdout, _ = run_command(
+            _command(specs, channels, subdirs), overrides(virtual_packages)
+        )
+    return _parse(returncode, stdout)
+
+
+async def solve_async(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str],
+    virtual_packages: list[VirtualPackage],
+) -> list[Record]:
+    with phase("spawn"):
+        returncode, stdout, _ = await run_command_async(
+            _command(specs, channels, subdirs), overrides(virtual_packages)
+        )
+    return _parse(returncode, stdout)
+
+
+def _command(specs: list[str], channels: list[str], subdirs: list[str]) -> list[str]:
     if subdirs:
         platform = (f"--platform={next(s for s in subdirs if s != 'noarch')}",)
     else:
         platform = ()
-    p = subprocess.run(
-        [
-            "mamba",
-            "create",
-            "--dry-run",
-            "--prefix=UNUSED",
-            "--json",
-            "--override-channels",
-            *([f"--channel={c}" for c in channels]),
-            *platform,
-            *specs,
-        ],
-        capture_output=True,
-        text=True,
-    )
-    data = json.loads(p.stdout)
-    if p.returncode:
-        raise SolutionNotFound("\n".join(data["solver_problems"]))
-    items = []
-    for r in data["actions"]["LINK"]:
-        if not r:
-            continue
-        items.append(
-            Record(
-                name=r["name"],
-                version=r["version"],
-                build=r["build_string"],
-                channel=r["channel"],
-                subdir=r["subdir"],
+    return [
+        "mamba",
+        "create",
+        "--dry-run",
+        "--prefix=UNUSED",
+        "--json",
+        "--override-channels",
+        *([f"--channel={c}" for c in channels]),
+        *platform,
+        *specs,
+    ]
+
+
+def _parse(returncode: int, stdout: str) -> list[Record]:
+    with phase("parse"):
+        data = json.loads(stdout)
+        if returncode:
+            raise SolutionNotFound("\n".join(data["solver_problems"]))
+        items = []
+        for r in data["actions"]["LINK"]:
+            if not r:
+                continue
+            items.append(
+                Record(
+                    name=r["name"],
+                    version=r["version"],
+                    build=r["build_string"],
+                    channel=r["channel"],
+                    subdir=r["subdir"],
+                )
             )
-        )
-    return items
+        return items
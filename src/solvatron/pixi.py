@@ -1,91 +1,232 @@
 import json
-import subprocess
+import re
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from multiprocessing.util import Finalize
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from textwrap import dedent
 
-from .common import Record, SolutionNotFound
+from rattler import MatchSpec
 
-from rattler import Platform
+from .common import (
+    Record,
+    SolutionNotFound,
+    current_platform,
+    phase,
+    run_command,
+    run_command_async,
+)
+from .virtual import VirtualPackage
 
+# Maximum number of idle workspaces kept around for reuse
+POOL_SIZE = 4
 
-def solve(specs: list[str], channels: list[str], subdirs: list[str]) -> list[Record]:
+# Bracket keys of a match spec that pixi's table form of a dependency can express
+_BRACKET_KEYS = {
+    "build",
+    "build_number",
+    "channel",
+    "fn",
+    "license",
+    "md5",
+    "sha256",
+    "subdir",
+    "url",
+    "version",
+}
+
+
+class _WorkspacePool:
+    """
+    Bounded pool of temporary pixi workspaces. Reusing the directories keeps pixi's
+    per-workspace state warm; workspaces beyond `size` are removed as soon as they are
+    released, and the rest when the process exits.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._free: list[TemporaryDirectory] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def workspace(self) -> Iterator[Path]:
+        with self._lock:
+            tmp = self._free.pop() if self._free else TemporaryDirectory(prefix="solvatron-pixi-")
+        try:
+            yield Path(tmp.name)
+        finally:
+            # A previous lock file would bias pixi towards the previous solution
+            Path(tmp.name, "pixi.lock").unlink(missing_ok=True)
+            with self._lock:
+                keep = len(self._free) < self._size
+                if keep:
+                    self._free.append(tmp)
+            if not keep:
+                tmp.cleanup()
+
+    def clear(self) -> None:
+        with self._lock:
+            free, self._free = self._free, []
+        for tmp in free:
+            tmp.cleanup()
+
+
+_POOL = _WorkspacePool(POOL_SIZE)
+# Unlike atexit, this also runs when a multiprocessing worker exits
+Finalize(None, _POOL.clear, exitpriority=0)
+
+
+def solve(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str],
+    virtual_packages: list[VirtualPackage],
+) -> list[Record]:
+    platform = _platform(subdirs)
+    with _POOL.workspace() as workspace:
+        _write_manifest(workspace, specs, channels, platform, virtual_packages)
+        with phase("spawn"):
+            returncode, stdout, stderr = run_command(_lock_command(workspace))
+    return _parse(returncode, stdout, stderr, platform)
+
+
+async def solve_async(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str],
+    virtual_packages: list[VirtualPackage],
+) -> list[Record]:
+    platform = _platform(subdirs)
+    with _POOL.workspace() as workspace:
+        _write_manifest(workspace, specs, channels, platform, virtual_packages)
+        with phase("spawn"):
+            returncode, stdout, stderr = await run_command_async(_lock_command(workspace))
+    return _parse(returncode, stdout, stderr, platform)
+
+
+def _platform(subdirs: list[str] | None) -> str:
     if subdirs:
-        platform = [next(s for s in subdirs if s != "noarch")]
-    else:
-        platform = [str(Platform.current())]
-
-    with TemporaryDirectory(delete=False) as tmp:
-        Path(tmp, "pixi.toml").write_text(
-            dedent(
-                f"""
-                [workspace]
-                authors = []
-                channels = {channels}
-                name = "UNUSED"
-                platforms = {platform}
-                version = "0.1.0"
-
-                [tasks]
-
-                [dependencies]
-                """
-            )
-        )
-        input_file = Path(tmp, "input.yml")
-        input_file.write_text(
-            dedent(
-                f"""
-                name: default
-                channels: {channels}
-                platforms: {platform}
-                dependencies: {specs}
-                """
-            )
-        )
-        subprocess.check_output(
-            [
-                "pixi",
-                "import",
-                "--format",
-                "conda-env",
-                input_file,
-                "--manifest-path",
-                tmp,
-            ],
-            stderr=subprocess.PIPE,
-        )
-    p = subprocess.run(
-        [
-            "pixi",
-            "lock",
-            "--json",
-            "--manifest-path",
-            tmp,
-        ],
-        capture_output=True,
-        text=True,
+        return next(s for s in subdirs if s != "noarch")
+    return current_platform()
+
+
+def _dependency(spec: str) -> str:
+    """
+    `spec` as a line of the [dependencies] table of pixi.toml. Raises ValueError for the
+    parts of a match spec that pixi cannot express, instead of dropping them.
+    """
+    match_spec = MatchSpec(spec, strict=False)
+    try:
+        name = match_spec.name.as_package_name()
+    except AttributeError:  # the matcher wraps a missing name
+        name = None
+    if name is None:
+        raise ValueError(f"pixi needs a package name: {spec}")
+    # The license and the URL are only in the canonical string, e.g. 'python[license="MIT"]'
+    brackets = dict(re.findall(r'(\w+)="([^"]*)"', str(match_spec).partition("[")[2]))
+    unsupported = set(brackets) - _BRACKET_KEYS
+    unsupported.update(
+        key for key in ("namespace", "extras", "condition") if getattr(match_spec, key)
     )
-    if p.returncode:
-        raise SolutionNotFound(p.stderr)
-    data = json.loads(p.stdout)
-    items = []
-    for r in data["environment"]["default"][platform[0]]:
-        url = r["after"]["conda"]
-        channel, subdir, fn = url.rsplit("/", 2)
-        channel = channel.replace("https://conda.anaconda.org/", "")
-        for ext in ".conda", ".tar.bz2":
-            if fn.endswith(ext):
-                fn = fn[: -len(ext)]
-                break
-        name, version, build = fn.rsplit("-", 2)
-        items.append(
-            Record(
-                name=name,
-                version=version,
-                build=build,
-                channel=channel,
-                subdir=subdir,
+    if unsupported:
+        raise ValueError(f"pixi cannot express {', '.join(sorted(unsupported))} in {spec}")
+
+    fields = {}
+    if match_spec.version or "url" not in brackets:
+        fields["version"] = str(match_spec.version or "*")
+    for key, value in (
+        ("build", match_spec.build),
+        ("build-number", match_spec.build_number),
+        ("channel", match_spec.channel and match_spec.channel.base_url),
+        ("subdir", match_spec.subdir),
+        ("md5", match_spec.md5 and match_spec.md5.hex()),
+        ("sha256", match_spec.sha256 and match_spec.sha256.hex()),
+        ("license", brackets.get("license")),
+        ("file-name", match_spec.file_name),
+        ("url", brackets.get("url")),
+    ):
+        if value:
+            fields[key] = str(value)
+    # JSON strings are valid TOML basic strings
+    table = ", ".join(f"{key} = {json.dumps(value)}" for key, value in fields.items())
+    return f"{json.dumps(name.normalized)} = {{ {table} }}"
+
+
+def _system_requirements(virtual_packages: list[VirtualPackage]) -> list[str]:
+    # pixi solves against its system requirements, not against the detected packages
+    versions = {package.name: package.version for package in virtual_packages}
+    lines = [
+        f"{key} = {json.dumps(versions[name])}"
+        for name, key in (("__linux", "linux"), ("__osx", "macos"), ("__cuda", "cuda"))
+        if name in versions
+    ]
+    if "__glibc" in versions:
+        lines.append(f'libc = {{ family = "glibc", version = {json.dumps(versions["__glibc"])} }}')
+    return lines
+
+
+def _write_manifest(
+    workspace: Path,
+    specs: list[str],
+    channels: list[str],
+    platform: str,
+    virtual_packages: list[VirtualPackage],
+):
+    with phase("write"):
+        Path(workspace, "pixi.toml").write_text(
+            "\n".join(
+                [
+                    "[workspace]",
+                    "authors = []",
+                    f"channels = {json.dumps(channels)}",
+                    'name = "UNUSED"',
+                    f"platforms = {json.dumps([platform])}",
+                    'version = "0.1.0"',
+                    "",
+                    "[system-requirements]",
+                    *_system_requirements(virtual_packages),
+                    "",
+                    "[dependencies]",
+                    *(_dependency(spec) for spec in specs),
+                    "",
+                ]
             )
         )
-    return items
+
+
+def _lock_command(workspace: Path) -> list[str]:
+    return [
+        "pixi",
+        "lock",
+        "--json",
+        "--manifest-path",
+        str(workspace),
+    ]
+
+
+def _parse(returncode: int, stdout: str, stderr: str, platform: str) -> list[Record]:
+    if returncode:
+        raise SolutionNotFound(stderr)
+    with phase("parse"):
+        data = json.loads(stdout)
+        items = []
+        for r in data["environment"]["default"][platform]:
+            url = r["after"]["conda"]
+            channel, subdir, fn = url.rsplit("/", 2)
+            channel = channel.replace("https://conda.anaconda.org/", "")
+            for ext in ".conda", ".tar.bz2":
+                if fn.endswith(ext):
+                    fn = fn[: -len(ext)]
+                    break
+            name, version, build = fn.rsplit("-", 2)
+            items.append(
+                Record(
+                    name=name,
+                    version=version,
+                    build=build,
+                    channel=channel,
+                    subdir=subdir,
+                )
+            )
+        return items
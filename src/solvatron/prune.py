@@ -0,0 +1,140 @@
+"""
+Minimal snapshots: only the records whose names are reachable from a set of specs.
+"""
+
+import argparse
+import json
+from collections import defaultdict
+from collections.abc import Iterable
+from contextlib import ExitStack
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from . import snapshot
+from .cli import ArgumentError, subdirs_for_platform
+from .common import SolutionNotFound, current_platform, spec_name, timed_solve
+
+_RECORD_KEYS = ("packages", "packages.conda")
+
+
+def dependency_names(path: Path) -> dict[str, set[str]]:
+    """
+    Map each package name in a repodata.json to the names of everything its records depend on.
+    """
+    repodata = json.loads(path.read_text())
+    names = defaultdict(set)
+    for key in _RECORD_KEYS:
+        for record in repodata.get(key, {}).values():
+            names[record["name"]].update(spec_name(dep) for dep in record.get("depends", ()))
+    return names
+
+
+def closure(dependencies: dict[str, set[str]], names: Iterable[str]) -> set[str]:
+    """
+    Names reachable from `names` through `dependencies`, which is what any solver could
+    possibly pick from. Virtual packages are left out; they are never in repodata.
+    """
+    reachable = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name in reachable or name.startswith("__"):
+            continue
+        reachable.add(name)
+        pending.extend(dependencies.get(name, ()))
+        if name == "python":
+            # conda and libmamba add pip as a python dependency by default
+            pending.append("pip")
+    return reachable
+
+
+def prune(source: str | Path, path: str | Path, specs: list[str]) -> dict:
+    """
+    Write a snapshot to `path` with the records of the `source` snapshot reachable from
+    `specs`, and return its manifest.
+    """
+    manifest = json.loads(Path(source, snapshot.MANIFEST).read_text())
+    subdir_paths = [
+        Path(channel["path"], subdir)
+        for channel in manifest["channels"].values()
+        for subdir in manifest["subdirs"]
+    ]
+    # Index one file at a time; the parsed repodata is much larger than these names
+    dependencies = defaultdict(set)
+    for subdir_path in subdir_paths:
+        for name, names in dependency_names(Path(source, subdir_path, "repodata.json")).items():
+            dependencies[name].update(names)
+    keep = closure(dependencies, (spec_name(spec) for spec in specs))
+
+    manifest["specs"] = specs
+    manifest["records"] = {}
+    for subdir_path in subdir_paths:
+        repodata = json.loads(Path(source, subdir_path, "repodata.json").read_text())
+        for key in _RECORD_KEYS:
+            if key in repodata:
+                repodata[key] = {
+                    fn: record for fn, record in repodata[key].items() if record["name"] in keep
+                }
+        Path(path, subdir_path).mkdir(parents=True, exist_ok=True)
+        Path(path, subdir_path, "repodata.json").write_text(json.dumps(repodata))
+        manifest.setdefault("sha256", {})[subdir_path.as_posix()] = snapshot.write_variants(
+            Path(path), subdir_path.as_posix()
+        )
+        manifest["records"][subdir_path.as_posix()] = sum(
+            len(repodata.get(key, ())) for key in _RECORD_KEYS
+        )
+    Path(path, snapshot.MANIFEST).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def verify(
+    solver: str, specs: list[str], channels: list[str], subdirs: list[str] | None, full, pruned
+) -> bool:
+    """
+    Solve against the full and the pruned snapshots, and report whether both agree.
+    """
+    from . import compare
+
+    results = [
+        timed_solve(solver, specs, channels, subdirs, snapshot=source) for source in (full, pruned)
+    ]
+    outcomes = [result.outcome for result in results]
+    if all(isinstance(outcome, SolutionNotFound) for outcome in outcomes):
+        same = True
+    elif any(isinstance(outcome, SolutionNotFound) for outcome in outcomes):
+        same = False
+    else:
+        same = not compare.diff(*outcomes)
+    print(
+        f"{'✅' if same else '❌'} {solver}: full {results[0].seconds:.3f}s, "
+        f"pruned {results[1].seconds:.3f}s{'' if same else ' (solutions differ!)'}"
+    )
+    return same
+
+
+def main(args: argparse.Namespace) -> int:
+    if not args.specs:
+        raise ArgumentError("One or more specs are required.")
+    if not args.channel:
+        raise ArgumentError("One or more channels are required.")
+    platforms = args.platform or [current_platform()]
+    with ExitStack() as stack:
+        source = args.snapshot
+        if source is None:
+            source = stack.enter_context(TemporaryDirectory(prefix="solvatron-snapshot-"))
+            snapshot.create(source, args.channel, list(dict.fromkeys([*platforms, "noarch"])))
+        else:
+            snapshot.local_channels(source, args.channel)
+        manifest = prune(source, args.output, args.specs)
+        for subdir_path, count in manifest["records"].items():
+            print(f"📦 {subdir_path}: {count} records")
+        print(f"Pruned snapshot written to {args.output}.")
+
+        exit_code = 0
+        if args.verify:
+            print()
+            subdirs = subdirs_for_platform(args.platform[0] if args.platform else None)
+            for solver in args.verify:
+                if not verify(solver, args.specs, args.channel, subdirs, source, args.output):
+                    exit_code = 1
+    return exit_code
@@ -1,36 +1,116 @@
 import asyncio
+import threading
+from functools import cache
 
-
-from rattler import MatchSpec, VirtualPackage, VirtualPackageOverrides, solve as rattler_solve
+from rattler import (
+    GenericVirtualPackage,
+    Gateway,
+    MatchSpec,
+    PackageName,
+    Platform,
+    Version,
+    solve as rattler_solve,
+)
 from rattler.exceptions import SolverError
 
-from .common import Record, SolutionNotFound
-
+from .common import Record, SolutionNotFound, phase
+from .virtual import VirtualPackage
 
-def solve(specs: list[str], channels: list[str], subdirs: list[str]) -> list[Record]:
-    return asyncio.run(_solve(specs, channels, subdirs))
 
+class Session:
+    """
+    Long-lived rattler state shared by all the solves in this process: a single Gateway
+    (and thus its in-memory and on-disk repodata caches), an event loop running in a
+    background thread.
+    """
 
-async def _solve(specs: list[str], channels: list[str], subdirs: list[str]) -> list[Record]:
-    try:
-        solved_records = await rattler_solve(
-            # Channels to use for solving
-            channels=channels,
-            platforms=subdirs,
-            # The specs to solve for
-            specs=[MatchSpec(spec, strict=False) for spec in specs],
-            # Virtual packages define the specifications of the environment
-            virtual_packages=VirtualPackage.detect(overrides=VirtualPackageOverrides.from_env()),
+    def __init__(self):
+        self.gateway = Gateway()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="solvatron-rattler", daemon=True
         )
-    except SolverError as exc:
-        raise SolutionNotFound(str(exc))
-    return [
-        Record(
-            name=r.name.normalized,
-            version=str(r.version),
-            build=r.build,
-            channel=r.channel.replace("https://conda.anaconda.org/", "").rstrip("/"),
-            subdir=r.subdir,
+        self._thread.start()
+
+    def solve(
+        self,
+        specs: list[str],
+        channels: list[str],
+        subdirs: list[str],
+        virtual_packages: list[VirtualPackage],
+    ) -> list[Record]:
+        # Safe to call from several threads at once; all solves share the same loop
+        future = asyncio.run_coroutine_threadsafe(
+            self.solve_async(specs, channels, subdirs, virtual_packages), self._loop
         )
-        for r in solved_records
-    ]
+        return future.result()
+
+    async def solve_async(
+        self,
+        specs: list[str],
+        channels: list[str],
+        subdirs: list[str],
+        virtual_packages: list[VirtualPackage],
+    ) -> list[Record]:
+        match_specs = [MatchSpec(spec, strict=False) for spec in specs]
+        platforms = subdirs or [str(Platform.current()), "noarch"]
+        with phase("fetch"):
+            # Load the records reachable from the specs into the gateway's in-memory cache,
+            # so the solve below does not pay for it
+            await self.gateway.query(channels, platforms, match_specs, recursive=True)
+        with phase("solve"):
+            try:
+                solved_records = await rattler_solve(
+                    # Channels to use for solving
+                    channels=channels,
+                    platforms=platforms,
+                    # The specs to solve for
+                    specs=match_specs,
+                    gateway=self.gateway,
+                    # Virtual packages define the specifications of the environment
+                    virtual_packages=[
+                        GenericVirtualPackage(PackageName(p.name), Version(p.version), p.build)
+                        for p in virtual_packages
+                    ],
+                )
+            except SolverError as exc:
+                raise SolutionNotFound(str(exc))
+        with phase("convert"):
+            return [
+                Record(
+                    name=r.name.normalized,
+                    version=str(r.version),
+                    build=r.build,
+                    channel=r.channel.replace("https://conda.anaconda.org/", "").rstrip("/"),
+                    subdir=r.subdir,
+                )
+                for r in solved_records
+            ]
+
+    def close(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+@cache
+def session() -> Session:
+    return Session()
+
+
+def solve(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str],
+    virtual_packages: list[VirtualPackage],
+) -> list[Record]:
+    return session().solve(specs, channels, subdirs, virtual_packages)
+
+
+async def solve_async(
+    specs: list[str],
+    channels: list[str],
+    subdirs: list[str],
+    virtual_packages: list[VirtualPackage],
+) -> list[Record]:
+    return await session().solve_async(specs, channels, subdirs, virtual_packages)
@@ -0,0 +1,233 @@
+"""
+Long-lived solve daemon. Requests are the JSON objects of the batch mode; they are solved
+by a pool of worker processes that keep their backend state (indexes, gateways, conda
+context) warm across requests.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from pathlib import Path
+
+from .batch import parse_request, respond
+from .cache import repodata_fingerprint
+from .cli import ArgumentError, cache_from_args
+from .common import SolveResult, current_platform, solver_to_callable, timed_solve
+from .virtual import for_subdirs
+
+
+def _import_backends(solvers: list[str]) -> None:
+    # Pay for the heavy imports when the worker starts, not on its first request
+    for solver in solvers:
+        solver_to_callable(solver)
+
+
+class Server:
+    """
+    Dispatches the solves of each request to a process pool. A background thread
+    polls the repodata fingerprints of the channels seen so far; when they change, a new
+    pool is warmed up with the latest requests for those channels and then replaces the
+    old one, which finishes its in-flight solves before exiting.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.options = {
+            "isolated": args.isolated,
+            "snapshot": args.snapshot,
+            "cache": cache_from_args(args),
+            "timeout": args.timeout,
+        }
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+        # (channels, subdirs) -> last (solver, specs) solved with them
+        self._recent: dict[tuple[tuple[str, ...], tuple[str, ...] | None], tuple] = {}
+        self._fingerprints: dict[tuple[str, str], str | None] = {}
+        self._stop = threading.Event()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.args.workers,
+            mp_context=get_context("spawn"),
+            initializer=_import_backends,
+            initargs=(self.args.solver or [],),
+        )
+
+    def solve_request(self, request: dict) -> list[SolveResult]:
+        solvers, specs, channels, subdirs = parse_request(request, self.args)
+        index = (tuple(channels), tuple(subdirs) if subdirs else None)
+        # Detected once per platform in this process, not once per worker
+        options = {**self.options, "virtual_packages": for_subdirs(subdirs)}
+        try:
+            with self._lock:
+                pool = self._pool
+                futures = [
+                    pool.submit(timed_solve, solver, specs, channels, subdirs, **options)
+                    for solver in solvers
+                ]
+                new_index = index not in self._recent
+                self._recent[index] = (solvers[-1], specs)
+            if new_index:
+                # Baseline for refresh(); checked while the solves run
+                fingerprints = {pair: repodata_fingerprint(*pair) for pair in _pairs(*index)}
+                with self._lock:
+                    for pair, fingerprint in fingerprints.items():
+                        self._fingerprints.setdefault(pair, fingerprint)
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            self._replace_broken(pool)
+            raise
+
+    def _replace_broken(self, pool: ProcessPoolExecutor) -> None:
+        # A worker died (e.g. a segfault in a backend), which breaks the whole pool. The
+        # request that hit it gets an error; the next ones get a new pool.
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = self._new_pool()
+        pool.shutdown(wait=False, cancel_futures=True)
+        print("⚠️  A worker process died; started a new pool", flush=True)
+
+    def _stale(self) -> list[tuple]:
+        with self._lock:
+            known = dict(self._fingerprints)
+            recent = dict(self._recent)
+        current = {pair: repodata_fingerprint(*pair) for pair in known}
+        # None means unknown (e.g. the network is down), not changed
+        changed = {
+            pair
+            for pair, fingerprint in current.items()
+            if fingerprint is not None and fingerprint != known[pair]
+        }
+        with self._lock:
+            for pair in changed:
+                self._fingerprints[pair] = current[pair]
+        return [
+            (index, job)
+            for index, job in recent.items()
+            if any(pair in changed for pair in _pairs(*index))
+        ]
+
+    def refresh(self) -> bool:
+        """
+        Replace the worker pool if the repodata of any channel in use changed.
+        """
+        stale = self._stale()
+        if not stale:
+            return False
+        pool = self._new_pool()
+        # Without the cache, so the solves actually load the new indexes; one per worker,
+        # although the pool does not guarantee that each worker gets one
+        options = {**self.options, "cache": None}
+        warmups = [
+            pool.submit(
+                timed_solve, solver, specs, list(channels), subdirs and list(subdirs), **options
+            )
+            for (channels, subdirs), (solver, specs) in stale
+            for _ in range(self.args.workers)
+        ]
+        for future in warmups:
+            future.result()
+        with self._lock:
+            pool, self._pool = self._pool, pool
+        pool.shutdown(wait=False)
+        print(f"🔄 Repodata changed; reloaded {len(stale)} index(es)", flush=True)
+        return True
+
+    def _refresh_forever(self) -> None:
+        while not self._stop.wait(self.args.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as exc:  # keep serving with the current pool
+                print(f"⚠️  Could not refresh indexes: {exc}", flush=True)
+
+    def start(self) -> None:
+        if self.args.refresh_interval:
+            threading.Thread(target=self._refresh_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._lock:
+            self._pool.shutdown(cancel_futures=True)
+
+
+def _pairs(channels, subdirs) -> list[tuple[str, str]]:
+    return [
+        (channel, subdir)
+        for channel in channels
+        for subdir in subdirs or (current_platform(), "noarch")
+    ]
+
+
+def _unix_handler(server: Server):
+    class Handler(socketserver.StreamRequestHandler):
+        # One JSON request per line; one JSON response line each, in order
+        def handle(self):
+            for lineno, line in enumerate(self.rfile, 1):
+                if not line.strip():
+                    continue
+                response, _ = respond(line.decode(), lineno, server.solve_request)
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+                self.wfile.flush()
+
+    return Handler
+
+
+def _http_handler(server: Server):
+    class Handler(BaseHTTPRequestHandler):
+        # POST one JSON request, get one JSON response
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            response, _ = respond(body.decode(), 1, server.solve_request)
+            payload = json.dumps(response).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(args: argparse.Namespace) -> int:
+    if (args.socket is None) == (args.port is None):
+        raise ArgumentError("Pass either --socket or --port.")
+    if args.workers < 1:
+        raise ArgumentError("--workers must be at least 1.")
+    if args.socket and not hasattr(socket, "AF_UNIX"):
+        raise ArgumentError("Unix sockets are not available here; use --port.")
+    server = Server(args)
+    if args.socket:
+        Path(args.socket).unlink(missing_ok=True)
+        transport = socketserver.ThreadingUnixStreamServer(args.socket, _unix_handler(server))
+        transport.daemon_threads = True
+        address = args.socket
+    else:
+        transport = ThreadingHTTPServer(("127.0.0.1", args.port), _http_handler(server))
+        address = f"http://127.0.0.1:{transport.server_address[1]}"
+    # Clean up (e.g. the socket file) when stopped by a service manager too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server.start()
+    print(f"🛰️  Serving on {address} with {args.workers} worker(s) (pid {os.getpid()})", flush=True)
+    try:
+        transport.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transport.server_close()
+        server.close()
+        if args.socket:
+            Path(args.socket).unlink(missing_ok=True)
+    return 0
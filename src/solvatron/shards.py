@@ -0,0 +1,186 @@
+"""
+Sharded repodata (CEP 16): instead of one repodata.json, a subdir publishes an index that
+maps each package name to the hash of a shard with all the records of that name, so a
+client only fetches the names it may need.
+
+    <subdir>/repodata_shards.msgpack.zst    {"info": {...}, "shards": {name: sha256}}
+    <shards_base_url>/<sha256>.msgpack.zst  {"packages": {...}, "packages.conda": {...}}
+"""
+
+import hashlib
+import os
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin
+from urllib.request import Request, urlopen
+
+import msgpack
+import zstandard
+
+from .common import spec_name
+
+INDEX = "repodata_shards.msgpack.zst"
+
+# sha256 -> decoded shard; shards are content-addressed, so they never go stale
+_SHARDS: dict[str, dict] = {}
+
+
+def default_path() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache", "solvatron", "shards")
+
+
+def _unpack(data: bytes) -> dict:
+    # decompressobj() does not need the frame to declare its decompressed size
+    return msgpack.unpackb(zstandard.ZstdDecompressor().decompressobj().decompress(data))
+
+
+def _write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _directory_url(url: str, relative: str) -> str:
+    url = urljoin(url, relative)
+    return url if url.endswith("/") else f"{url}/"
+
+
+@dataclass
+class ShardIndex:
+    url: str
+    # name -> sha256 of its shard
+    shards: dict[str, bytes]
+    base_url: str
+    shards_base_url: str
+
+    def package_url(self, filename: str) -> str:
+        return f"{self.base_url}{filename}"
+
+    def shard(self, name: str, cache_dir: Path | None = None) -> dict:
+        """
+        The shard of `name`. Remote shards are kept in `cache_dir` by hash.
+        """
+        digest = self.shards[name].hex()
+        if (shard := _SHARDS.get(digest)) is not None:
+            return shard
+        url = f"{self.shards_base_url}{digest}.msgpack.zst"
+        path = Path(cache_dir or default_path(), f"{digest}.msgpack.zst")
+        remote = not url.startswith("file://")
+        if remote and path.is_file():
+            data = path.read_bytes()
+        else:
+            with urlopen(url, timeout=60) as response:
+                data = response.read()
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise ValueError(f"Shard {url} does not match its hash")
+            if remote:
+                _write(path, data)
+        shard = _SHARDS[digest] = _unpack(data)
+        return shard
+
+
+def fetch_index(url: str, cache_dir: Path | None = None) -> ShardIndex | None:
+    """
+    Shard index of the subdir at `url`, or None if it does not publish sharded repodata.
+    Remote indexes are kept in `cache_dir` and revalidated with their ETag.
+    """
+    index_url = f"{url.rstrip('/')}/{INDEX}"
+    cache_path = etag_path = None
+    headers = {}
+    if not index_url.startswith("file://"):
+        digest = hashlib.sha256(index_url.encode()).hexdigest()
+        cache_path = Path(cache_dir or default_path(), "indexes", f"{digest}.msgpack.zst")
+        etag_path = cache_path.with_name(f"{digest}.etag")
+        if cache_path.is_file() and etag_path.is_file():
+            headers["If-None-Match"] = etag_path.read_text()
+    try:
+        with urlopen(Request(index_url, headers=headers), timeout=60) as response:
+            data = response.read()
+            etag = response.headers.get("ETag")
+    except HTTPError as exc:
+        if exc.code == 304:
+            data, etag = cache_path.read_bytes(), None
+        elif exc.code == 404:
+            return None
+        else:
+            raise
+    except URLError as exc:
+        if not isinstance(exc.reason, FileNotFoundError):
+            raise
+        return None
+    if cache_path and etag:
+        _write(cache_path, data)
+        _write(etag_path, etag.encode())
+
+    index = _unpack(data)
+    info = index.get("info", {})
+    return ShardIndex(
+        url=index_url,
+        shards=index["shards"],
+        base_url=_directory_url(index_url, info.get("base_url") or "./"),
+        shards_base_url=_directory_url(index_url, info.get("shards_base_url") or "./"),
+    )
+
+
+def records(shard: dict, tar_bz2_only: bool = False) -> dict[str, dict]:
+    """
+    The records of a shard by filename, as they would be in repodata.json: minus the
+    removed ones, minus the .tar.bz2 ones that also have a .conda (unless `tar_bz2_only`)
+    and with hex digests.
+    """
+    conda = {} if tar_bz2_only else shard.get("packages.conda", {})
+    stems = {filename.removesuffix(".conda") for filename in conda}
+    removed = set(shard.get("removed", ()))
+    found = {}
+    for filename, record in [*shard.get("packages", {}).items(), *conda.items()]:
+        if filename in removed or filename.removesuffix(".tar.bz2") in stems:
+            continue
+        found[filename] = {
+            key: value.hex() if isinstance(value, bytes) else value
+            for key, value in record.items()
+        }
+    return found
+
+
+def closure(
+    indexes: list[ShardIndex],
+    names: Iterable[str],
+    cache_dir: Path | None = None,
+    dependencies: dict[str, set[str]] | None = None,
+) -> list[dict[str, dict]]:
+    """
+    Fetch the shards of `names`, and of everything their records depend on, from any of
+    `indexes`. Returns the shards found in each index, by name. Like prune.closure(), but
+    the dependencies are only known once the shards are fetched, so it goes one level of
+    the graph at a time, fetching each level concurrently. `dependencies` maps the names
+    in repodata that is not sharded to what their records depend on, which is followed too.
+    """
+    dependencies = dependencies or {}
+    found = [{} for _ in indexes]
+    seen = set()
+    pending = {name for name in names if not name.startswith("__")}
+    with ThreadPoolExecutor() as pool:
+        while pending:
+            seen |= pending
+            futures = {
+                (position, name): pool.submit(index.shard, name, cache_dir)
+                for name in pending
+                for position, index in enumerate(indexes)
+                if name in index.shards
+            }
+            followed = {dep for name in pending for dep in dependencies.get(name, ())}
+            # conda and libmamba add pip as a python dependency by default
+            pending = (followed | {"pip"}) if "python" in pending else followed
+            for (position, name), future in futures.items():
+                shard = found[position][name] = future.result()
+                pending.update(
+                    spec_name(dep)
+                    for record in records(shard).values()
+                    for dep in record.get("depends", ())
+                )
+            pending = {name for name in pending if name not in seen and not name.startswith("__")}
+    return found
@@ -0,0 +1,197 @@
+"""
+Frozen local copies of channel repodata, so every solver reads the same data, offline.
+
+A snapshot is a directory with one file-based channel per snapshotted channel, plus a
+manifest mapping the original channel names to them:
+
+    snapshot.json
+    conda-forge/linux-64/repodata.json{,.zst} and repodata.solv
+    conda-forge/noarch/...
+
+The manifest also records the SHA-256 of each repodata.json, which the bundled .solv files
+are validated against, so a snapshot can be copied elsewhere or mounted read-only.
+"""
+
+import argparse
+import hashlib
+import json
+import shutil
+from dataclasses import replace
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.request import url2pathname
+
+from .cli import ArgumentError
+from .common import Record, SolutionNotFound, SolveTimeout, current_platform
+
+MANIFEST = "snapshot.json"
+
+
+def _channel_url(channel: str) -> str:
+    if "://" not in channel:
+        channel = f"https://conda.anaconda.org/{channel}"
+    return channel.rstrip("/")
+
+
+def _channel_dir(channel: str) -> str:
+    # 'conda-forge' -> 'conda-forge'; 'https://repo.prefix.dev/foo' -> 'repo.prefix.dev/foo'
+    return channel.split("://", 1)[-1].strip("/")
+
+
+def _download(url: str, path: Path, subdir: str) -> None:
+    from urllib.error import URLError
+    from urllib.request import urlopen
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    try:
+        with urlopen(url, timeout=60) as response, open(tmp_path, "wb") as f:
+            shutil.copyfileobj(response, f)
+    except URLError as exc:
+        if getattr(exc, "code", None) != 404 and not isinstance(exc.reason, FileNotFoundError):
+            raise
+        # Channels do not need to provide every subdir, but file channels must
+        tmp_path.write_text(
+            json.dumps({"info": {"subdir": subdir}, "packages": {}, "packages.conda": {}})
+        )
+    tmp_path.replace(path)
+
+
+def _compress(path: Path) -> bool:
+    try:
+        import zstandard
+    except ImportError:
+        return False
+    with open(path, "rb") as src, open(path.with_name(f"{path.name}.zst"), "wb") as dst:
+        zstandard.ZstdCompressor().copy_stream(src, dst)
+    return True
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(2**20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_solv(subdir_path: Path, relative: str, digest: str) -> bool:
+    try:
+        from .libmambapy import write_snapshot_solv
+    except ImportError:
+        return False
+    write_snapshot_solv(subdir_path, relative, digest)
+    return True
+
+
+def create(path: str | Path, channels: list[str], subdirs: list[str]) -> dict:
+    """
+    Download the current repodata of `channels` for `subdirs` into `path` and return the
+    manifest. Channels snapshotted there before are kept, unless they are refreshed now.
+    """
+    path = Path(path)
+    try:
+        previous = json.loads(Path(path, MANIFEST).read_text())
+    except (OSError, ValueError):
+        previous = {}
+    manifest = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "subdirs": subdirs,
+        "channels": previous.get("channels", {}),
+        "sha256": previous.get("sha256", {}),
+    }
+    for channel in channels:
+        directory = _channel_dir(channel)
+        manifest["channels"][channel] = {"url": _channel_url(channel), "path": directory}
+        for subdir in subdirs:
+            relative = Path(directory, subdir).as_posix()
+            _download(
+                f"{_channel_url(channel)}/{subdir}/repodata.json",
+                Path(path, relative, "repodata.json"),
+                subdir,
+            )
+            manifest["sha256"][relative] = write_variants(path, relative)
+    Path(path, MANIFEST).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def write_variants(path: Path, relative: str) -> str:
+    """
+    (Re)write the compressed and .solv variants of the repodata.json in the `relative`
+    subdir (e.g. 'conda-forge/noarch') of the snapshot in `path`. Returns its SHA-256,
+    for the manifest.
+    """
+    subdir_path = Path(path, relative)
+    for stale in ("repodata.json.zst", "repodata.solv"):
+        Path(subdir_path, stale).unlink(missing_ok=True)
+    digest = _sha256(Path(subdir_path, "repodata.json"))
+    _compress(Path(subdir_path, "repodata.json"))
+    _write_solv(subdir_path, relative, digest)
+    return digest
+
+
+def local_channels(path: str | Path, channels: list[str]) -> list[str]:
+    """
+    file:// URLs of the snapshotted copies of `channels`.
+    """
+    try:
+        manifest = json.loads(Path(path, MANIFEST).read_text())
+    except (OSError, ValueError) as exc:
+        raise ArgumentError(f"{path} is not a solvatron snapshot: {exc}")
+    if missing := [channel for channel in channels if channel not in manifest["channels"]]:
+        raise ArgumentError(f"Channel(s) not in snapshot {path}: {', '.join(missing)}")
+    return [
+        Path(path, manifest["channels"][channel]["path"]).resolve().as_uri()
+        for channel in channels
+    ]
+
+
+def restore_channels(
+    outcome: list[Record] | SolutionNotFound | SolveTimeout, local: list[str], channels: list[str]
+) -> list[Record] | SolutionNotFound | SolveTimeout:
+    """
+    Report records from the snapshot under their original channel names. Each backend
+    spells file channels a bit differently, so match on the path of the local copy.
+    """
+    if isinstance(outcome, SolutionNotFound | SolveTimeout):
+        return outcome
+    paths = [Path(url2pathname(url[len("file://") :])).as_posix().strip("/") for url in local]
+    records = []
+    for record in outcome:
+        for local_path, channel in zip(paths, channels):
+            if record.channel.rstrip("/").endswith(local_path):
+                record = replace(record, channel=channel)
+                break
+        records.append(record)
+    return records
+
+
+def subdir_digest(path: Path) -> tuple[str, str] | None:
+    """
+    Where the subdir at `path` is in its snapshot (e.g. 'conda-forge/noarch') and the
+    SHA-256 of its repodata.json recorded in the manifest, or None if it is not part of a
+    snapshot, or of one written before digests were recorded.
+    """
+    for parent in path.parents:
+        try:
+            manifest = json.loads(Path(parent, MANIFEST).read_text())
+        except (OSError, ValueError):
+            continue
+        relative = path.relative_to(parent).as_posix()
+        digest = manifest.get("sha256", {}).get(relative)
+        return (relative, digest) if digest else None
+    return None
+
+
+def main(args: argparse.Namespace) -> int:
+    if not args.channel:
+        raise ArgumentError("One or more channels are required.")
+    subdirs = [*(args.platform or [current_platform()]), "noarch"]
+    manifest = create(args.output, args.channel, list(dict.fromkeys(subdirs)))
+    for channel, entry in manifest["channels"].items():
+        for subdir in manifest["subdirs"]:
+            files = sorted(Path(args.output, entry["path"], subdir).glob("repodata.*"))
+            sizes = ", ".join(f"{f.name} {f.stat().st_size / 2**20:.1f} MiB" for f in files)
+            print(f"📦 {channel}/{subdir}: {sizes}")
+    print(f"Snapshot written to {args.output}. Solve against it with --snapshot {args.output}.")
+    return 0
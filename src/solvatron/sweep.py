@@ -0,0 +1,187 @@
+"""
+Solve one set of specs for many platforms and solvers at once.
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from .cli import ArgumentError, cache_from_args
+from .common import KNOWN_PLATFORMS, Solution, SolveResult, current_platform, timed_solve
+from .snapshot import local_channels
+from .virtual import VirtualPackage, detect, environ
+
+# Virtual packages assumed when solving for another OS; see subdirs_for_platform() in cli.py
+DEFAULT_OVERRIDES: dict[str, dict[str, str]] = {
+    "linux": {"LINUX": "5.10", "GLIBC": "2.17", "UNIX": "1"},
+    "osx": {"OSX": "11.0", "UNIX": "1"},
+    "win": {"WIN": "10"},
+}
+
+
+def parse_overrides(values: list[str], platforms: list[str]) -> dict[str, dict[str, str]]:
+    """
+    Map each platform to its CONDA_OVERRIDE_* variables: the defaults for cross-solving,
+    unless set in the environment, and then the `[PLATFORM:]NAME=VALUE` values on top.
+    """
+    host_os = current_platform().split("-")[0]
+    overrides = {}
+    for platform in platforms:
+        target_os = platform.split("-")[0]
+        defaults = DEFAULT_OVERRIDES.get(target_os, {}) if target_os != host_os else {}
+        overrides[platform] = {
+            f"CONDA_OVERRIDE_{name}": value
+            for name, value in defaults.items()
+            if f"CONDA_OVERRIDE_{name}" not in os.environ
+        }
+    for value in values:
+        target, _, assignment = value.rpartition(":")
+        name, sep, version = assignment.partition("=")
+        if not sep or not name or (target and target not in KNOWN_PLATFORMS):
+            raise ArgumentError(f"Invalid --override '{value}'; expected [PLATFORM:]NAME=VALUE.")
+        name = name.upper().removeprefix("CONDA_OVERRIDE_")
+        for platform in [target] if target else platforms:
+            if platform in overrides:
+                overrides[platform][f"CONDA_OVERRIDE_{name}"] = version
+    return overrides
+
+
+def virtual_packages(
+    platforms: list[str], overrides: dict[str, dict[str, str]]
+) -> dict[str, tuple[VirtualPackage, ...]]:
+    """
+    Detect the virtual packages of each platform once, with its `overrides` set in the
+    environment meanwhile, for all the solvers to share.
+    """
+    detected = {}
+    for platform in platforms:
+        with environ(overrides[platform]):
+            detected[platform] = detect(platform)
+    return detected
+
+
+def sweep(
+    solvers: list[str],
+    specs: list[str],
+    channels: list[str],
+    platforms: list[str],
+    overrides: dict[str, dict[str, str]],
+    jobs: int | None = None,
+    **options,
+):
+    """
+    Yield (platform, result) pairs as the solves finish. The first platform is solved
+    with every solver before the others start, so the repodata they all need (noarch,
+    at least) is downloaded once per solver and then read from its warm caches, instead
+    of being fetched by every platform at the same time.
+    """
+    detected = virtual_packages(platforms, overrides)
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=get_context("spawn")) as pool:
+
+        def submit(platform: str) -> dict:
+            return {
+                pool.submit(
+                    timed_solve,
+                    solver,
+                    specs,
+                    channels,
+                    [platform, "noarch"],
+                    virtual_packages=detected[platform],
+                    **options,
+                ): platform
+                for solver in solvers
+            }
+
+        first, *rest = platforms
+        futures = submit(first)
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+        futures = {}
+        for platform in rest:
+            futures.update(submit(platform))
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def _cell(result: SolveResult | None) -> str:
+    if result is None:
+        return ""
+    status = {"solved": "✅", "unsolvable": "💥", "timeout": "⌛"}[result.status]
+    return f"{status} {result.seconds:.2f}s"
+
+
+def _agreement(results: dict[str, SolveResult]) -> str:
+    from . import compare
+
+    if len(results) < 2:
+        return ""
+    if not all(isinstance(r.outcome, Solution) for r in results.values()):
+        return "-"
+    differing = compare.table({solver: r.outcome for solver, r in results.items()})
+    return "same" if not differing else f"{len(differing)} pkgs differ"
+
+
+def main(args: argparse.Namespace) -> int:
+    if not args.specs:
+        raise ArgumentError("One or more specs are required.")
+    if not args.solver:
+        raise ArgumentError("One or more solvers are required.")
+    if not args.channel:
+        raise ArgumentError("One or more channels are required.")
+    if args.jobs is not None and args.jobs < 1:
+        raise ArgumentError("--jobs must be at least 1.")
+    if args.snapshot:
+        local_channels(args.snapshot, args.channel)
+    platforms = list(dict.fromkeys(args.platform or [current_platform()]))
+    overrides = parse_overrides(args.override, platforms)
+
+    matrix: dict[str, dict[str, SolveResult]] = {platform: {} for platform in platforms}
+    for platform, result in sweep(
+        args.solver,
+        args.specs,
+        args.channel,
+        platforms,
+        overrides,
+        jobs=args.jobs,
+        isolated=args.isolated,
+        snapshot=args.snapshot,
+        cache=cache_from_args(args),
+        timeout=args.timeout,
+    ):
+        matrix[platform][result.solver] = result
+        if args.json:
+            print(json.dumps({"platform": platform, **result.to_dict()}), flush=True)
+        else:
+            print(f"{_cell(result)}  {platform} / {result.solver}", flush=True)
+
+    exit_code = max(
+        (result.exit_code for results in matrix.values() for result in results.values()),
+        default=0,
+    )
+    if args.json:
+        summary = {
+            platform: {
+                solver: {"status": result.status, "seconds": result.seconds}
+                for solver, result in results.items()
+            }
+            for platform, results in matrix.items()
+        }
+        print(json.dumps({"matrix": summary}), flush=True)
+        return exit_code
+
+    print()
+    header = ["platform", *args.solver, *(["solutions"] if len(args.solver) > 1 else [])]
+    rows = [
+        [
+            platform,
+            *(_cell(matrix[platform].get(solver)) for solver in args.solver),
+            *([_agreement(matrix[platform])] if len(args.solver) > 1 else []),
+        ]
+        for platform in platforms
+    ]
+    widths = [max(len(cell) for cell in column) for column in zip(header, *rows)]
+    for line in (header, *rows):
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip())
+    return exit_code
@@ -0,0 +1,187 @@
+"""
+Virtual packages (__glibc, __cuda, ...) detected once per process and target platform,
+so that all the backends solve against the same set instead of probing the system
+each on its own.
+"""
+
+import os
+import re
+import subprocess
+import sys
+from collections.abc import Iterable
+from contextlib import contextmanager
+from functools import cache
+from typing import NamedTuple
+
+from .common import current_platform
+
+# CONDA_OVERRIDE_<NAME> variables understood by conda and mamba; an empty value removes
+# the package. For __archspec it overrides the build string, for the others the version.
+OVERRIDABLE: tuple[str, ...] = ("archspec", "cuda", "glibc", "linux", "osx", "win")
+
+_UNIX = ("freebsd", "linux", "osx")
+
+# archspec names of the target architectures, when not solving for this machine
+_GENERIC_ARCHSPEC = {
+    "32": "x86",
+    "64": "x86_64",
+    "aarch64": "aarch64",
+    "arm64": "arm64",
+    "armv6l": "armv6l",
+    "armv7l": "armv7l",
+    "ppc64": "ppc64",
+    "ppc64le": "ppc64le",
+    "riscv64": "riscv64",
+    "s390x": "s390x",
+}
+
+# Run in a subprocess, as conda does: loading the CUDA driver can crash or hang
+_CUDA_PROBE = """
+import ctypes, sys
+names = {"darwin": ["libcuda.dylib"], "win32": ["nvcuda.dll"]}.get(
+    sys.platform, ["libcuda.so", "libcuda.so.1"]
+)
+for name in names:
+    try:
+        lib = ctypes.CDLL(name)
+    except OSError:
+        continue
+    version = ctypes.c_int()
+    if lib.cuInit(0) == 0 and lib.cuDriverGetVersion(ctypes.byref(version)) == 0:
+        print(f"{version.value // 1000}.{version.value % 1000 // 10}")
+    break
+"""
+
+
+class VirtualPackage(NamedTuple):
+    name: str
+    version: str
+    build: str = "0"
+
+    def __str__(self):
+        return f"{self.name}={self.version}={self.build}"
+
+
+def _version(value: str) -> str | None:
+    match = re.match(r"\d+(\.\d+)*", value)
+    return match.group() if match else None
+
+
+def _cuda_version() -> str | None:
+    try:
+        probe = subprocess.run(
+            [sys.executable, "-c", _CUDA_PROBE], capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return probe.stdout.strip() or None
+
+
+def _host_archspec() -> str:
+    import platform
+
+    try:
+        import archspec.cpu
+    except ImportError:
+        return platform.machine()
+    return archspec.cpu.host().name
+
+
+def _host_versions() -> dict[str, str | None]:
+    import platform
+
+    libc, libc_version = platform.libc_ver()
+    return {
+        "archspec": _host_archspec(),
+        "cuda": _cuda_version(),
+        "glibc": libc_version if libc == "glibc" else None,
+        "linux": _version(platform.release()) if sys.platform == "linux" else None,
+        "osx": platform.mac_ver()[0] or None,
+        "win": platform.win32_ver()[1] or None,
+    }
+
+
+@cache
+def _detect(platform: str, overrides: tuple[tuple[str, str], ...]) -> tuple[VirtualPackage, ...]:
+    target_os, _, arch = platform.partition("-")
+    host = current_platform()
+    if target_os != host.partition("-")[0]:
+        values = {"archspec": _GENERIC_ARCHSPEC.get(arch)}
+    elif platform != host:
+        # Same OS, another architecture: the OS versions still apply, the CPU does not
+        values = {**_host_versions(), "archspec": _GENERIC_ARCHSPEC.get(arch)}
+    else:
+        values = _host_versions()
+    for name, value in overrides:
+        values[name.removeprefix("CONDA_OVERRIDE_").lower()] = value or None
+
+    packages = []
+    if (build := values.get("archspec")) is not None:
+        packages.append(VirtualPackage("__archspec", "1", build))
+    if (version := values.get("cuda")) is not None:
+        packages.append(VirtualPackage("__cuda", version))
+    if target_os == "linux":
+        if (version := values.get("glibc")) is not None:
+            packages.append(VirtualPackage("__glibc", version))
+        packages.append(VirtualPackage("__linux", values.get("linux") or "0"))
+    if target_os == "osx" and (version := values.get("osx")) is not None:
+        packages.append(VirtualPackage("__osx", version))
+    if target_os in _UNIX:
+        packages.append(VirtualPackage("__unix", "0"))
+    if target_os == "win":
+        packages.append(VirtualPackage("__win", values.get("win") or "0"))
+    return tuple(packages)
+
+
+def detect(platform: str | None = None) -> tuple[VirtualPackage, ...]:
+    """
+    Virtual packages for solving for `platform` (this one by default), honouring the
+    CONDA_OVERRIDE_* variables. Versions are only probed on this machine when solving for
+    its own OS (for another architecture, the CPU is a generic one); otherwise they must
+    come from the overrides.
+    """
+    overrides = tuple(
+        sorted(
+            (name, value)
+            for name, value in os.environ.items()
+            if name.startswith("CONDA_OVERRIDE_")
+            and name.removeprefix("CONDA_OVERRIDE_").lower() in OVERRIDABLE
+        )
+    )
+    return _detect(platform or current_platform(), overrides)
+
+
+def for_subdirs(subdirs: Iterable[str] | None) -> tuple[VirtualPackage, ...]:
+    return detect(next((subdir for subdir in subdirs or () if subdir != "noarch"), None))
+
+
+def overrides(packages: Iterable[VirtualPackage]) -> dict[str, str]:
+    """
+    CONDA_OVERRIDE_* variables that make conda and mamba detect exactly `packages`.
+    """
+    values = {package.name.removeprefix("__"): package for package in packages}
+    return {
+        f"CONDA_OVERRIDE_{name.upper()}": ""
+        if name not in values
+        else values[name].build
+        if name == "archspec"
+        else values[name].version
+        for name in OVERRIDABLE
+    }
+
+
+@contextmanager
+def environ(variables: dict[str, str]):
+    """
+    Set `variables` in os.environ, restoring the previous values afterwards.
+    """
+    previous = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
@@ -1,9 +1,19 @@
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import subprocess
 import sys
+import time
+from contextlib import nullcontext
 
 import pytest
 
-from solvatron.common import KNOWN_SOLVERS
+from solvatron import compare
+from solvatron.benchmark import summarize
 from solvatron.cli import ArgumentError, cli, main
+from solvatron.common import KNOWN_SOLVERS, Record, SolutionNotFound, solve_many_async
 
 
 @pytest.fixture(
@@ -44,6 +54,11 @@ def test_failure(solver):
     )
 
 
+@pytest.mark.parametrize("solver", [s for s in KNOWN_SOLVERS if s.startswith("conda")])
+def test_isolated(solver):
+    assert run("--solver", solver, "--isolated", "--channel", "conda-forge", "python") == 0
+
+
 def test_several():
     assert (
         run(
@@ -59,6 +74,22 @@ def test_several():
     )
 
 
+def test_several_sequential():
+    assert (
+        run(
+            "--solver",
+            "rattler",
+            "--solver",
+            "pixi",
+            "--sequential",
+            "--channel",
+            "conda-forge",
+            "python",
+        )
+        == 0
+    )
+
+
 def test_compare():
     assert (
         run(
@@ -75,6 +106,81 @@ def test_compare():
     )
 
 
+def test_compare_several():
+    assert (
+        run(
+            "--solver",
+            "rattler",
+            "--solver",
+            "pixi",
+            "--solver",
+            "libmambapy",
+            "--compare",
+            "--channel",
+            "conda-forge",
+            "python",
+        )
+        == 0
+    )
+
+
+def test_compare_engine():
+    a = [
+        Record("attr", "2.5.2", "h0", "conda-forge", "linux-64"),
+        Record("libgcc", "15.2.0", "h0", "conda-forge", "linux-64"),
+        Record("mpi", "1.0.1", "openmpi", "conda-forge", "noarch"),
+        Record("zlib", "1.3.1", "h0", "conda-forge", "linux-64"),
+        Record("same", "1", "0", "conda-forge", "noarch"),
+    ]
+    b = [
+        Record("libgcc", "14.2.0", "h1", "conda-forge", "linux-64"),
+        Record("mpi", "1.0.1", "openmpi", "conda-forge", "linux-64"),
+        Record("zlib", "1.3.1", "h1", "conda-forge", "linux-64"),
+        Record("same", "1", "0", "conda-forge", "noarch"),
+        Record("ucx", "1.19.1", "h0", "conda-forge", "linux-64"),
+    ]
+    changes = compare.diff(a, b)
+    assert [(c.name, c.kind) for c in changes] == [
+        ("attr", "removed"),
+        ("libgcc", "version"),
+        ("mpi", "channel"),
+        ("ucx", "added"),
+        ("zlib", "build"),
+    ]
+    assert str(changes[1]) == "~ libgcc: 15.2.0-h0 vs 14.2.0-h1"
+    rows = compare.table({"a": a, "b": b, "c": a})
+    assert "same" not in rows
+    assert rows["ucx"] == {"a": None, "b": b[-1], "c": None}
+    assert compare.matrix({"a": a, "b": b, "c": a}) == {
+        "a": {"a": 0, "b": 5, "c": 0},
+        "b": {"a": 5, "b": 0, "c": 5},
+        "c": {"a": 0, "b": 5, "c": 0},
+    }
+
+
+def test_solution():
+    import pickle
+
+    from solvatron.common import Solution
+
+    records = [
+        Record("zlib", "1.3.1", "h0", "conda-forge", "linux-64"),
+        Record("attr", "2.5.2", "h0", "conda-forge", "linux-64"),
+        Record("mpi", "1.0.1", "openmpi", "conda-forge", "noarch"),
+    ]
+    solution = Solution(records)
+    assert list(solution) == sorted(records)
+    assert solution[0] == records[1] and solution[-1] == records[0]
+    assert str(solution[0]) == "conda-forge/linux-64::attr-2.5.2-h0"
+    assert solution == records and solution == Solution(reversed(records))
+    assert hash(solution) == hash(Solution(reversed(records)))
+    assert solution != Solution(records[:2])
+    assert pickle.loads(pickle.dumps(solution)) == solution
+    assert solution[0].channel is solution[1].channel
+    assert compare.diff(solution, Solution(records)) == []
+    assert compare.table({"a": solution, "b": Solution(records)}) == {}
+
+
 def test_compare_all(solver):
     if KNOWN_SOLVERS[0] == solver:
         pytest.skip()
@@ -92,6 +198,27 @@ def test_compare_all(solver):
     )
 
 
+def test_json(capsys):
+    assert (
+        run(
+            "--solver",
+            "rattler",
+            "--solver",
+            "pixi",
+            "--compare",
+            "--json",
+            "--channel",
+            "conda-forge",
+            "python",
+        )
+        == 0
+    )
+    *solves, comparison = map(json.loads, capsys.readouterr().out.splitlines())
+    assert {solve["solver"] for solve in solves} == {"rattler", "pixi"}
+    assert all(solve["exit_code"] == 0 and solve["records"] for solve in solves)
+    assert comparison["comparison"]["identical"]
+
+
 @pytest.mark.skipif(sys.platform.startswith("linux"), reason="Only not Linux")
 def test_cross_solve_linux(monkeypatch):
     with pytest.raises(ArgumentError):
@@ -117,3 +244,723 @@ def test_cross_solve_win(monkeypatch):
         run("--platform", "win-64", "--solver", "rattler", "-c", "conda-forge", "python")
     monkeypatch.setenv("CONDA_OVERRIDE_WIN", "10")
     assert run("--platform", "win-64", "--solver", "rattler", "-c", "conda-forge", "python") == 0
+
+
+def test_batch(tmp_path):
+    requests = tmp_path / "requests.jsonl"
+    requests.write_text(
+        "\n".join(
+            [
+                json.dumps({"id": "ok", "specs": ["python"]}),
+                json.dumps({"id": "ko", "specs": ["python=3", "numpy=*=*py27*"]}),
+                json.dumps({"specs": ["python"], "solvers": ["unknown"]}),
+            ]
+        )
+    )
+    output = tmp_path / "results.jsonl"
+    assert (
+        run("batch", "-s", "rattler", "-c", "conda-forge", "-o", str(output), str(requests)) == 1
+    )
+    ok, ko, error = map(json.loads, output.read_text().splitlines())
+    assert ok["id"] == "ok"
+    assert ok["results"][0]["status"] == "solved"
+    assert {"fetch", "solve"} <= set(ok["results"][0]["phases"])
+    assert ko["results"][0]["status"] == "unsolvable"
+    assert error["id"] == 3
+    assert "unknown" in error["error"]
+
+
+def test_batch_errors():
+    import argparse
+
+    from solvatron.batch import parse_request, respond
+
+    args = argparse.Namespace(
+        solver=["rattler"], channel=["conda-forge"], snapshot=None, platform=None
+    )
+
+    def solve_request(request):
+        parse_request(request, args)
+        raise FileNotFoundError("No such file or directory: 'mamba'")
+
+    response, code = respond('{"id": "x", "specs": "python"}', 1, solve_request)
+    assert code == 1 and response == {"id": "x", "error": "'specs' must be a list of strings."}
+    response, code = respond('{"specs": ["python"], "channels": [1]}', 2, solve_request)
+    assert response["error"] == "'channels' must be a list of strings."
+    response, code = respond('{"specs": ["python"]}', 3, solve_request)
+    assert code == 1 and response["error"].startswith("FileNotFoundError: No such file")
+
+
+def test_benchmark(tmp_path):
+    samples = tmp_path / "samples.csv"
+    stats = tmp_path / "stats.json"
+    assert (
+        run(
+            "benchmark",
+            "--solver",
+            "rattler",
+            "--channel",
+            "conda-forge",
+            "--suite",
+            "small",
+            "--trials",
+            "2",
+            "--csv",
+            str(samples),
+            "--json",
+            str(stats),
+        )
+        == 0
+    )
+    assert len(samples.read_text().splitlines()) == 1 + 1 + 2  # header, cold, warm
+    data = json.loads(stats.read_text())
+    assert {(s["solver"], s["mode"]) for s in data["stats"]} == {
+        ("rattler", "cold"),
+        ("rattler", "warm"),
+    }
+
+
+def test_benchmark_failures(tmp_path, monkeypatch):
+    from solvatron.common import EXIT_TIMEOUT
+
+    def fake_run(solver, *args, **kwargs):
+        for trial, (seconds, status) in enumerate([(1.0, "solved"), (60.0, "timeout")]):
+            yield {
+                "solver": solver,
+                "mode": "warm",
+                "trial": trial,
+                "seconds": seconds,
+                "status": status,
+            }
+
+    monkeypatch.setattr("solvatron.benchmark.run", fake_run)
+    stats = tmp_path / "stats.json"
+    args = ["benchmark", "-s", "rattler", "-c", "conda-forge", "--json", str(stats), "python"]
+    assert run(*args) == EXIT_TIMEOUT
+    (summary,) = json.loads(stats.read_text())["stats"]
+    # The timed out trial is counted, not timed
+    assert (summary["n"], summary["failed"], summary["mean"]) == (1, 1, 1.0)
+
+
+def test_benchmark_summarize():
+    summary = summarize([3.0, 1.0, 2.0, 4.0])
+    assert summary["n"] == 4
+    assert summary["min"] == 1.0
+    assert summary["median"] == 2.5
+    assert summary["mean"] == 2.5
+    assert summary["p95"] == 4.0
+    assert summarize([1.0])["stddev"] == 0.0
+
+
+def test_solve_many_async():
+    jobs = [
+        (solver, specs, ["conda-forge"], None)
+        for solver in ("rattler", "pixi", "libmambapy")
+        for specs in (["python"], ["python=3", "numpy=*=*py27*"])
+    ]
+    results = asyncio.run(solve_many_async(jobs, concurrency=3))
+    assert [r.solver for r in results] == [job[0] for job in jobs]
+    for result, (_, specs, _, _) in zip(results, jobs):
+        assert isinstance(result.outcome, SolutionNotFound) == (len(specs) == 2)
+
+
+def test_pixi_dependency():
+    from solvatron.pixi import _dependency
+
+    md5 = "0123456789abcdef0123456789abcdef"
+    assert _dependency(f"https://example.com/channel/linux-64::numpy 2.* *_3[md5={md5}]") == (
+        '"numpy" = { version = "2.*", build = "*_3", '
+        'channel = "https://example.com/channel/", subdir = "linux-64", '
+        f'md5 = "{md5}" }}'
+    )
+    assert _dependency("python[build_number=3, license=MIT]") == (
+        '"python" = { version = "*", build-number = "==3", license = "MIT" }'
+    )
+    with pytest.raises(ValueError):
+        _dependency("*")
+
+
+def test_pixi_workspace_pool():
+    from solvatron import pixi
+
+    pixi._POOL.clear()
+    for _ in range(2):
+        assert run("--solver", "pixi", "--channel", "conda-forge", "python") == 0
+        assert run("--solver", "pixi", "--channel", "conda-forge", "numpy=*=*py27*") == 1
+    # solves run one at a time, so a single workspace is enough
+    assert len(pixi._POOL._free) == 1
+    workspace = pixi._POOL._free[0].name
+    pixi._POOL.clear()
+    assert not os.path.exists(workspace)
+
+
+# Generous enough for slow CI machines, but well below what importing any backend costs
+STARTUP_BUDGET = 0.5
+
+
+def test_startup_time():
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "solvatron", "--help"], check=True, capture_output=True
+        )
+        timings.append(time.perf_counter() - start)
+    assert min(timings) < STARTUP_BUDGET
+
+
+def test_cli_imports_no_backend():
+    code = (
+        "import sys; from solvatron.cli import cli; "
+        "cli(['-s', 'rattler', '-s', 'pixi', '--platform', 'osx-arm64', 'python']); "
+        "print(*sorted(sys.modules))"
+    )
+    modules = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout.split()
+    for heavy in ("rattler", "conda", "libmambapy", "colorama"):
+        assert heavy not in modules
+
+
+def test_cache(tmp_path, capsys):
+    args = ("--json", "--cache-dir", str(tmp_path), "-s", "rattler", "-c", "conda-forge")
+    for flag, expected in [("--cache", "miss"), ("--cache", "hit"), ("--refresh-cache", "miss")]:
+        assert run(flag, *args, "python") == 0
+        assert json.loads(capsys.readouterr().out)["cache"] == expected
+    assert run("--no-cache", *args, "python") == 0
+    assert "cache" not in json.loads(capsys.readouterr().out)
+
+
+def test_cache_eviction(tmp_path):
+    from solvatron.cache import SolveCache
+
+    cache = SolveCache(path=tmp_path)
+    record = Record(name="python", version="3.12.0", build="0", channel="c", subdir="noarch")
+    cache.store("solved", [record], 2.0)
+    cache.store("unsolvable", SolutionNotFound("nope"), 1.0)
+    assert cache.load("solved") == ([record], 2.0)
+    assert str(cache.load("unsolvable").outcome) == "nope"
+
+    # "solved" was used last, so it survives a size-based eviction
+    os.utime(tmp_path / "unsolvable.json", (0, 0))
+    cache.max_size = (tmp_path / "solved.json").stat().st_size
+    cache.evict()
+    assert sorted(p.stem for p in tmp_path.iterdir()) == ["solved"]
+    cache.max_age = -1
+    cache.evict()
+    assert cache.load("solved") is None
+
+
+def test_cache_eviction_throttled(tmp_path):
+    from solvatron.cache import SolveCache
+
+    cache = SolveCache(path=tmp_path)
+    evictions = []
+    evict = cache.evict
+    cache.evict = lambda: evictions.append(None) or evict()
+    for n in range(3):
+        cache.store(f"unsolvable-{n}", SolutionNotFound("nope"), 1.0)
+    # Only the first store lists the directory...
+    assert len(evictions) == 1
+    # ... until what was stored since exceeds the maximum size
+    cache.max_size = (tmp_path / "unsolvable-0.json").stat().st_size * 4
+    cache.store("unsolvable-3", SolutionNotFound("nope"), 1.0)
+    assert len(evictions) == 1
+    cache.store("unsolvable-4", SolutionNotFound("nope"), 1.0)
+    assert len(evictions) == 2
+    assert len(list(tmp_path.glob("*.json"))) == 4
+
+
+def _local_channel(path, packages: dict[str, list[str]]) -> str:
+    """
+    Write a noarch-only channel with one 1.0 record per package name, depending on the
+    given specs, and return its URL.
+    """
+    (path / "noarch").mkdir(parents=True)
+    records = {
+        f"{name}-1.0-0.tar.bz2": {
+            "name": name,
+            "version": "1.0",
+            "build": "0",
+            "build_number": 0,
+            "depends": depends,
+            "subdir": "noarch",
+        }
+        for name, depends in packages.items()
+    }
+    (path / "noarch" / "repodata.json").write_text(
+        json.dumps({"info": {"subdir": "noarch"}, "packages": records})
+    )
+    return path.as_uri()
+
+
+def test_solv_cache(tmp_path, capsys):
+    from solvatron import libmambapy
+
+    channel = _local_channel(tmp_path, {"solvatron-test": []})
+
+    def solv_cache():
+        # Without the database of the previous solve, so the .solv files are read again
+        libmambapy._DATABASES.clear()
+        capsys.readouterr()
+        assert run("--json", "-s", "libmambapy", "-c", channel, "solvatron-test") == 0
+        return json.loads(capsys.readouterr().out)["solv_cache"]
+
+    assert set(solv_cache()) == {"miss"}
+    assert set(solv_cache()) == {"hit"}
+    # A corrupt .solv file is rebuilt from the JSON
+    fetched = libmambapy._fetch_channel(channel, "noarch")
+    fetched.json_path.with_suffix(".solv").write_bytes(b"corrupt")
+    assert solv_cache()["invalid"] == 1
+    assert set(solv_cache()) == {"hit"}
+
+
+def test_database_reuse(tmp_path):
+    from solvatron import libmambapy
+    from solvatron.virtual import VirtualPackage
+
+    a = _local_channel(tmp_path / "a", {"solvatron-a": []})
+    b = _local_channel(tmp_path / "b", {"solvatron-b": []})
+    subdirs = ["noarch"]
+    virtual = [VirtualPackage("__unix", "0")]
+    db = libmambapy.setup_database([a, b], subdirs, virtual)
+    assert libmambapy.setup_database([a, b], subdirs, virtual) is db
+    # Channel order is priority, so it is another database
+    assert libmambapy.setup_database([b, a], subdirs, virtual) is not db
+    # So are other virtual packages, and it replaces the previous one
+    other = libmambapy.setup_database([a, b], subdirs, [*virtual, VirtualPackage("__cuda", "12")])
+    assert other is not db
+    assert libmambapy.setup_database([a, b], subdirs, virtual) is not other
+
+
+def test_database_lru(tmp_path, monkeypatch):
+    from solvatron import libmambapy
+    from solvatron.virtual import VirtualPackage
+
+    monkeypatch.setattr(libmambapy, "MAX_DATABASES", 2)
+    monkeypatch.setattr(libmambapy, "_DATABASES", libmambapy.OrderedDict())
+    a, b, c = (
+        _local_channel(tmp_path / name, {f"solvatron-{name}": []}) for name in ("a", "b", "c")
+    )
+    subdirs = ["noarch"]
+    virtual = [VirtualPackage("__unix", "0")]
+    db = libmambapy.setup_database([a], subdirs, virtual)
+    libmambapy.setup_database([b], subdirs, virtual)
+    # Using the first one again makes the second the least recently used
+    assert libmambapy.setup_database([a], subdirs, virtual) is db
+    libmambapy.setup_database([c], subdirs, virtual)
+    assert [channels for channels, *_ in libmambapy._DATABASES] == [(a,), (c,)]
+
+
+def test_snapshot(tmp_path, capsys, solver):
+    upstream = tmp_path / "upstream"
+    channel = _local_channel(upstream, {"solvatron-test": []})
+    snapshot = str(tmp_path / "snapshot")
+    assert run("snapshot", "-c", channel, snapshot) == 0
+    # The upstream channel is gone; only the snapshot can be solved against
+    (upstream / "noarch" / "repodata.json").unlink()
+    capsys.readouterr()
+    assert (
+        run("--json", "--snapshot", snapshot, "-s", solver, "-c", channel, "solvatron-test") == 0
+    )
+    (record,) = json.loads(capsys.readouterr().out)["records"]
+    assert record["channel"] == channel
+    with pytest.raises(ArgumentError):
+        run("--snapshot", snapshot, "-s", solver, "-c", "conda-forge", "python")
+
+
+def test_snapshot_digests(tmp_path):
+    import shutil
+
+    from solvatron import snapshot
+
+    channel = _local_channel(tmp_path / "upstream", {"solvatron-test": []})
+    manifest = snapshot.create(tmp_path / "snapshot", [channel], ["noarch"])
+    ((relative, digest),) = manifest["sha256"].items()
+    repodata = tmp_path / "snapshot" / relative / "repodata.json"
+    assert digest == hashlib.sha256(repodata.read_bytes()).hexdigest()
+    # Where the snapshot is does not matter
+    shutil.move(tmp_path / "snapshot", tmp_path / "moved")
+    assert snapshot.subdir_digest(tmp_path / "moved" / relative) == (relative, digest)
+    assert snapshot.subdir_digest(tmp_path / "upstream" / "noarch") is None
+
+
+def test_prune_closure():
+    from solvatron.prune import closure
+
+    dependencies = {"a": {"b", "__glibc"}, "b": {"python"}, "c": {"d"}, "python": set()}
+    assert closure(dependencies, ["a"]) == {"a", "b", "python", "pip"}
+    assert closure(dependencies, ["c", "missing"]) == {"c", "d", "missing"}
+
+
+def test_prune(tmp_path, solver):
+    channel = _local_channel(
+        tmp_path / "upstream",
+        {"solvatron-a": ["solvatron-b >=1"], "solvatron-b": [], "solvatron-c": []},
+    )
+    pruned = tmp_path / "pruned"
+    assert run("prune", "-c", channel, "--verify", solver, str(pruned), "solvatron-a") == 0
+    manifest = json.loads((pruned / "snapshot.json").read_text())
+    assert manifest["specs"] == ["solvatron-a"]
+    repodata = json.loads(next(pruned.glob("**/noarch/repodata.json")).read_text())
+    assert sorted(r["name"] for r in repodata["packages"].values()) == [
+        "solvatron-a",
+        "solvatron-b",
+    ]
+
+
+def _sharded_channel(path, packages: dict[str, list[str]]) -> str:
+    """
+    Like _local_channel(), but with sharded repodata (CEP 16) only.
+    """
+    msgpack = pytest.importorskip("msgpack")
+    zstandard = pytest.importorskip("zstandard")
+    from solvatron.common import current_platform
+
+    channel = _local_channel(path, packages)
+    compress = zstandard.ZstdCompressor().compress
+    for subdir in (current_platform(), "noarch"):
+        repodata = path / subdir / "repodata.json"
+        records = json.loads(repodata.read_text())["packages"] if repodata.exists() else {}
+        repodata.unlink(missing_ok=True)
+        (path / subdir / "shards").mkdir(parents=True)
+        shards = {}
+        for filename, record in records.items():
+            data = compress(msgpack.packb({"packages": {filename: record}}))
+            shards[record["name"]] = hashlib.sha256(data).digest()
+            (path / subdir / "shards" / f"{shards[record['name']].hex()}.msgpack.zst").write_bytes(
+                data
+            )
+        index = {"info": {"subdir": subdir, "shards_base_url": "./shards/"}, "shards": shards}
+        (path / subdir / "repodata_shards.msgpack.zst").write_bytes(compress(msgpack.packb(index)))
+    return channel
+
+
+def test_shards(tmp_path):
+    channel = _sharded_channel(
+        tmp_path / "channel",
+        {"solvatron-a": ["solvatron-b >=1", "__glibc"], "solvatron-b": [], "solvatron-c": []},
+    )
+    from solvatron import shards
+
+    assert shards.fetch_index(f"{channel}/win-32") is None
+    index = shards.fetch_index(f"{channel}/noarch")
+    assert (
+        index.package_url("solvatron-a-1.0-0.tar.bz2")
+        == f"{channel}/noarch/solvatron-a-1.0-0.tar.bz2"
+    )
+    (found,) = shards.closure([index], ["solvatron-a"])
+    assert sorted(found) == ["solvatron-a", "solvatron-b"]
+    # solvatron-x is only in repodata that is not sharded
+    (found,) = shards.closure(
+        [index], ["solvatron-x"], dependencies={"solvatron-x": {"solvatron-c"}}
+    )
+    assert sorted(found) == ["solvatron-c"]
+
+
+def test_libmambapy_shards(tmp_path, capsys):
+    channel = _sharded_channel(
+        tmp_path / "channel",
+        {"solvatron-a": ["solvatron-b >=1"], "solvatron-b": [], "solvatron-c": []},
+    )
+    assert run("--json", "-s", "libmambapy-shards", "-c", channel, "solvatron-a") == 0
+    records = json.loads(capsys.readouterr().out)["records"]
+    assert sorted(record["name"] for record in records) == ["solvatron-a", "solvatron-b"]
+    assert {record["channel"] for record in records} == {channel}
+
+
+def test_libmambapy_shards_mixed(tmp_path, capsys):
+    sharded = _sharded_channel(
+        tmp_path / "sharded", {"solvatron-b": ["solvatron-c"], "solvatron-c": []}
+    )
+    full = _local_channel(tmp_path / "full", {"solvatron-a": ["solvatron-b"]})
+    args = ["--json", "-s", "libmambapy-shards", "-c", full, "-c", sharded, "solvatron-a"]
+    assert run(*args) == 0
+    records = json.loads(capsys.readouterr().out)["records"]
+    assert sorted(record["name"] for record in records) == [
+        "solvatron-a",
+        "solvatron-b",
+        "solvatron-c",
+    ]
+
+
+def test_resources(capsys, monkeypatch, solver):
+    # Earlier tests ran other solvers in this process, which would hide the peak
+    monkeypatch.setattr("solvatron.common._HOSTED", set())
+    assert run("--json", "--sequential", "-s", solver, "-c", "conda-forge", "python") == 0
+    resources = json.loads(capsys.readouterr().out)["resources"]
+    assert resources["peak_rss_mb"] > 0
+    assert resources["user_seconds"] + resources["system_seconds"] > 0
+
+
+def test_resources_child_process():
+    from solvatron.common import resource_usage, run_command
+
+    usage = {}
+    with resource_usage(usage):
+        code = "import sys; x = bytearray(2**28); sys.exit(3)"
+        assert run_command([sys.executable, "-c", code]) == (3, "", "")
+    # The peak is the child's, which allocated 256 MiB, not ours
+    assert usage["peak_rss_mb"] >= 256
+
+
+def test_resources_shared_process(monkeypatch):
+    from solvatron.common import timed_solve
+
+    monkeypatch.setattr("solvatron.common._HOSTED", set())
+    monkeypatch.setattr("solvatron.common.solve", lambda **kwargs: [])
+    args = [["python"], ["conda-forge"], ("linux-64", "noarch")]
+    first, again, other = (
+        timed_solve(solver, *args, virtual_packages=())
+        for solver in ("libmambapy", "libmambapy", "rattler")
+    )
+    assert "peak_rss_mb" in first.resources and "peak_rss_mb" in again.resources
+    # rattler's peak would include libmambapy's index
+    assert "peak_rss_mb" not in other.resources
+    assert "user_seconds" in other.resources
+
+
+def test_run_command_timeout():
+    from solvatron.common import _DEADLINE, SolveTimeout, resource_usage, run_command
+
+    # The grandchild keeps stdout open; unless it is killed too, run_command() waits for it
+    code = "import subprocess, sys; subprocess.run([sys.executable, '-c', 'while True: pass'])"
+    for measured in (False, True):
+        token = _DEADLINE.set(time.monotonic() + 1)
+        start = time.perf_counter()
+        try:
+            with pytest.raises(SolveTimeout), resource_usage({}) if measured else nullcontext():
+                run_command([sys.executable, "-c", code])
+        finally:
+            _DEADLINE.reset(token)
+        assert time.perf_counter() - start < 10
+
+
+def test_worker_spawn_timeout():
+    from solvatron.common import SolveTimeout, _solve_in_worker
+
+    # Spawning the worker and importing the backend alone take longer than the timeout
+    start = time.perf_counter()
+    with pytest.raises(SolveTimeout):
+        _solve_in_worker("rattler", ["python"], ["conda-forge"], ("linux-64", "noarch"), 0.01, ())
+    assert time.perf_counter() - start < 5
+
+
+def test_timed_solve_async_context(monkeypatch):
+    from solvatron.common import _DEADLINE, _PHASES, _SOLV_CACHE, timed_solve_async
+
+    async def solve_async(**kwargs):
+        return []
+
+    async def main():
+        await timed_solve_async(
+            "rattler",
+            ["python"],
+            ["conda-forge"],
+            ("linux-64", "noarch"),
+            timeout=60.0,
+            virtual_packages=(),
+        )
+        return _DEADLINE.get(), _PHASES.get(), _SOLV_CACHE.get()
+
+    monkeypatch.setattr("solvatron.common.solve_async", solve_async)
+    monkeypatch.setattr("solvatron.common._in_process", lambda solver, **options: False)
+    # Nothing leaks into the context of the caller
+    assert asyncio.run(main()) == (None, None, None)
+
+
+def test_timeout(capsys, solver):
+    from solvatron.common import EXIT_TIMEOUT
+
+    args = ("--json", "--timeout", "0.01", "-s", solver, "-c", "conda-forge", "python")
+    assert run(*args) == EXIT_TIMEOUT
+    result = json.loads(capsys.readouterr().out)
+    assert result["status"] == "timeout"
+    assert result["exit_code"] == EXIT_TIMEOUT
+    assert "records" not in result
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Unix sockets only")
+def test_serve(tmp_path):
+    import socket
+
+    path = tmp_path / "solvatron.sock"
+    argv = [sys.executable, "-m", "solvatron", "serve", "-s", "rattler", "-c", "conda-forge"]
+    with subprocess.Popen([*argv, "--socket", str(path)]) as proc:
+        try:
+            for _ in range(100):
+                if path.exists():
+                    break
+                time.sleep(0.1)
+            with socket.socket(socket.AF_UNIX) as sock:
+                sock.connect(str(path))
+                stream = sock.makefile("rwb")
+                for request in (
+                    {"id": "ok", "specs": ["python"]},
+                    {"id": "ko", "specs": ["python=3", "numpy=*=*py27*"]},
+                    {"id": "again", "specs": ["python"]},
+                ):
+                    stream.write(json.dumps(request).encode() + b"\n")
+                stream.flush()
+                ok, ko, again = (json.loads(stream.readline()) for _ in range(3))
+        finally:
+            proc.terminate()
+    assert ok["id"] == "ok" and ok["results"][0]["status"] == "solved"
+    assert ko["results"][0]["status"] == "unsolvable"
+    assert again["results"][0]["records"] == ok["results"][0]["records"]
+    assert not path.exists()
+
+
+def test_serve_broken_pool(monkeypatch):
+    import argparse
+    from concurrent.futures.process import BrokenProcessPool
+
+    from solvatron.serve import Server
+
+    # No backends to import, so only os._exit() can break the pool
+    args = argparse.Namespace(
+        solver=[],
+        channel=["conda-forge"],
+        platform=None,
+        isolated=False,
+        snapshot=None,
+        cache=False,
+        timeout=None,
+        workers=1,
+        refresh_interval=0,
+    )
+    monkeypatch.setattr("solvatron.serve.cache_from_args", lambda args: None)
+    monkeypatch.setattr("solvatron.serve.repodata_fingerprint", lambda *pair: "etag")
+    server = Server(args)
+    try:
+        broken = server._pool
+        # Kill the worker, as a segfault in a backend would
+        with pytest.raises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+        with pytest.raises(BrokenProcessPool):
+            server.solve_request({"specs": ["python"], "solvers": ["rattler"]})
+        assert server._pool is not broken
+    finally:
+        server.close()
+
+
+def test_sweep(capsys):
+    platforms = ["linux-64", "osx-arm64", "win-64"]
+    assert (
+        run(
+            "sweep",
+            "--json",
+            *(f"--platform={platform}" for platform in platforms),
+            "-s",
+            "rattler",
+            "-s",
+            "pixi",
+            "-c",
+            "conda-forge",
+            "python",
+        )
+        == 0
+    )
+    *solves, matrix = map(json.loads, capsys.readouterr().out.splitlines())
+    assert sorted((s["platform"], s["solver"]) for s in solves) == [
+        (platform, solver) for platform in platforms for solver in ("pixi", "rattler")
+    ]
+    assert {r["subdir"] for s in solves if s["platform"] == "win-64" for r in s["records"]} <= {
+        "win-64",
+        "noarch",
+    }
+    assert list(matrix["matrix"]) == platforms
+
+
+def test_sweep_overrides(monkeypatch):
+    from solvatron.sweep import parse_overrides
+
+    monkeypatch.setattr("solvatron.sweep.current_platform", lambda: "linux-64")
+    monkeypatch.setenv("CONDA_OVERRIDE_OSX", "14.0")
+    overrides = parse_overrides(
+        ["linux-aarch64:glibc=2.28", "CUDA=12"], ["linux-aarch64", "osx-64"]
+    )
+    # Native OS: no defaults; osx: defaults, but not for what the environment sets
+    assert overrides == {
+        "linux-aarch64": {"CONDA_OVERRIDE_GLIBC": "2.28", "CONDA_OVERRIDE_CUDA": "12"},
+        "osx-64": {"CONDA_OVERRIDE_UNIX": "1", "CONDA_OVERRIDE_CUDA": "12"},
+    }
+    with pytest.raises(ArgumentError):
+        parse_overrides(["glibc"], ["linux-64"])
+
+
+def test_virtual_packages(monkeypatch):
+    from solvatron import virtual
+
+    monkeypatch.setattr("solvatron.virtual.current_platform", lambda: "linux-64")
+    monkeypatch.setenv("CONDA_OVERRIDE_OSX", "14.0")
+    monkeypatch.setenv("CONDA_OVERRIDE_CUDA", "12.4")
+    # Cross-solving: only the overrides, and a generic archspec for the target
+    packages = virtual.detect("osx-arm64")
+    assert list(map(str, packages)) == [
+        "__archspec=1=arm64",
+        "__cuda=12.4=0",
+        "__osx=14.0=0",
+        "__unix=0=0",
+    ]
+    assert virtual.for_subdirs(["noarch", "osx-arm64"]) == packages
+    assert virtual.overrides(packages) == {
+        "CONDA_OVERRIDE_ARCHSPEC": "arm64",
+        "CONDA_OVERRIDE_CUDA": "12.4",
+        "CONDA_OVERRIDE_GLIBC": "",
+        "CONDA_OVERRIDE_LINUX": "",
+        "CONDA_OVERRIDE_OSX": "14.0",
+        "CONDA_OVERRIDE_WIN": "",
+    }
+    # An empty override removes the package, even if the host has it
+    monkeypatch.setenv("CONDA_OVERRIDE_CUDA", "")
+    monkeypatch.setenv("CONDA_OVERRIDE_GLIBC", "2.17")
+    names = {package.name: package.version for package in virtual.detect("linux-64")}
+    assert "__cuda" not in names and names["__glibc"] == "2.17" and "__unix" in names
+    with virtual.environ({"CONDA_OVERRIDE_GLIBC": "2.28", "SOLVATRON_TEST": "1"}):
+        assert virtual.detect("linux-64") != virtual.detect("linux-aarch64")
+        assert os.environ["CONDA_OVERRIDE_GLIBC"] == "2.28"
+    assert os.environ["CONDA_OVERRIDE_GLIBC"] == "2.17" and "SOLVATRON_TEST" not in os.environ
+
+
+def test_virtual_packages_other_arch(monkeypatch):
+    from solvatron import virtual
+
+    host = {"archspec": "zen4", "cuda": None, "glibc": "2.36", "linux": "6.1", "osx": None}
+    # A fresh cache, so the fake host does not leak into other tests
+    monkeypatch.setattr(virtual, "_detect", functools.cache(virtual._detect.__wrapped__))
+    monkeypatch.setattr("solvatron.virtual.current_platform", lambda: "linux-64")
+    monkeypatch.setattr("solvatron.virtual._host_versions", lambda: dict(host, win=None))
+    for name in virtual.OVERRIDABLE:
+        monkeypatch.delenv(f"CONDA_OVERRIDE_{name.upper()}", raising=False)
+    # Same OS: the host's OS versions, but not its CPU
+    assert list(map(str, virtual.detect("linux-aarch64"))) == [
+        "__archspec=1=aarch64",
+        "__glibc=2.36=0",
+        "__linux=6.1=0",
+        "__unix=0=0",
+    ]
+    assert "__archspec=1=zen4" in map(str, virtual.detect("linux-64"))
+    # Another OS: nothing from the host
+    assert list(map(str, virtual.detect("osx-arm64"))) == ["__archspec=1=arm64", "__unix=0=0"]
+
+
+def test_conflicts_minimize():
+    from solvatron.conflicts import minimize
+
+    def unsolvable(candidates):
+        return [{"b", "g"} <= set(candidate) for candidate in candidates]
+
+    specs = list("abcdefgh")
+    assert minimize(specs, unsolvable) == ["b", "g"]
+    assert minimize(["a", "b"], lambda candidates: [c == ["b"] for c in candidates]) == ["b"]
+
+
+def test_conflicts(capsys):
+    specs = ["python=3.12", "requests", "numpy=*=*py27*", "zlib"]
+    assert run("conflicts", "-s", "libmambapy", "-c", "conda-forge", "-j", "2", *specs) == 1
+    out = capsys.readouterr().out
+    minimal = out.split("Minimal conflicting specs")[1].split("This is what")[0]
+    assert "numpy=*=*py27*" in minimal
+    assert "requests" not in minimal and "zlib" not in minimal
+    assert run("conflicts", "-s", "libmambapy", "-c", "conda-forge", "python", "zlib") == 0